@@ -0,0 +1,300 @@
+"""Benchmark dos caminhos mais usados da API.
+
+Popula o banco com UserFactory/CharacterFactory e mede vazão e percentis
+de latência de cada rota chamando o app ASGI direto (sem rede). O
+resultado sai em JSON para acompanhar regressões commit a commit.
+
+O banco nunca é o DATABASE_URL do app: sem --database-url (ou a variável
+BENCH_DATABASE_URL) sobe um Postgres descartável com testcontainers. Um
+banco informado precisa ser um Postgres vazio (os modelos usam tsvector e
+pg_trgm); se ele já tiver tabelas o benchmark se recusa a rodar, já que
+apaga no fim as tabelas que criou. Réplicas e o Redis do .env também ficam
+de fora: as leituras vão para o mesmo banco e o cache é o da memória.
+
+Uso: python -m benchmarks.api [--users N] [--characters N] [--requests N]
+     [--concurrency N] [--database-url URL] [--output resultado.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from itertools import cycle
+
+import factory
+import httpx
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from testcontainers.postgres import PostgresContainer
+
+from benchmarks.git import current_commit
+from senpaisearch.app import app
+from senpaisearch.cache import get_response_cache
+from senpaisearch.database import get_engine
+from senpaisearch.models import table_registry
+from senpaisearch.security import get_password_hash
+from senpaisearch.settings import get_settings
+from tests.conftest import CharacterFactory, UserFactory
+
+PASSWORD = 'benchmark'
+# Poucos valores repetidos, para os filtros encontrarem personagens
+ANIMES = ('Naruto', 'Bleach', 'One Piece', 'Monogatari', 'Frieren')
+HIERARCHIES = ('Hokage', 'Capitão', 'Yonkou', 'Vilão', 'Mago')
+PAGE_SIZE = 20
+
+
+async def seed(users: int, characters: int) -> list[str]:
+    """Cria os usuários e seus personagens; devolve os emails."""
+    # Todos usam a mesma senha: o hash é caro e o custo de verificar é igual
+    password = await get_password_hash(PASSWORD)
+
+    async with AsyncSession(get_engine(), expire_on_commit=False) as session:
+        db_users = UserFactory.create_batch(users, password=password)
+        session.add_all(db_users)
+        await session.commit()
+
+        for user in db_users:
+            session.add_all(
+                CharacterFactory.create_batch(
+                    characters,
+                    user_id=user.id,
+                    # O nome é único na tabela inteira; o Faker repetiria
+                    name=factory.Sequence(lambda n: f'Personagem {n}'),
+                    anime=factory.Iterator(ANIMES),
+                    hierarchy=factory.Iterator(HIERARCHIES),
+                )
+            )
+            await session.commit()
+
+    return [user.email for user in db_users]
+
+
+def summarize(name: str, latencies: list[float], elapsed: float) -> dict:
+    milliseconds = sorted(latency * 1000 for latency in latencies)
+    percentiles = statistics.quantiles(milliseconds, n=100, method='inclusive')
+
+    return {
+        'name': name,
+        'requests': len(milliseconds),
+        'throughput_rps': round(len(milliseconds) / elapsed, 1),
+        'latency_ms': {
+            'min': round(milliseconds[0], 3),
+            'mean': round(statistics.fmean(milliseconds), 3),
+            'p50': round(percentiles[49], 3),
+            'p90': round(percentiles[89], 3),
+            'p95': round(percentiles[94], 3),
+            'p99': round(percentiles[98], 3),
+            'max': round(milliseconds[-1], 3),
+        },
+    }
+
+
+async def measure(name, requests, concurrency, send, prepare=None):
+    """Dispara send(i) para cada requisição, no máximo concurrency de vez.
+
+    prepare(i), se houver, roda antes de cada requisição, fora da medição.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def run_one(i):
+        async with semaphore:
+            if prepare:
+                await prepare(i)
+            start = time.perf_counter()
+            response = await send(i)
+            latencies.append(time.perf_counter() - start)
+
+        if response.is_error:
+            raise RuntimeError(
+                f'{name}: {response.status_code} {response.text}'
+            )
+        return response
+
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(run_one(i) for i in range(requests)))
+    result = summarize(name, latencies, time.perf_counter() - start)
+
+    return result, responses
+
+
+async def run_scenarios(
+    client: httpx.AsyncClient,
+    emails: list[str],
+    requests: int,
+    concurrency: int,
+) -> list[dict]:
+    results = []
+
+    def login(i):
+        return client.post(
+            '/auth/token',
+            data={'username': emails[i % len(emails)], 'password': PASSWORD},
+        )
+
+    result, responses = await measure(
+        'auth_token', requests, concurrency, login
+    )
+    results.append(result)
+
+    # Um token por usuário, reaproveitado nos cenários seguintes
+    headers = [
+        {'Authorization': f'Bearer {response.json()["access_token"]}'}
+        for response in responses[: len(emails)]
+    ]
+    anime = cycle(ANIMES)
+    hierarchy = cycle(HIERARCHIES)
+
+    def list_characters(i):
+        return client.get(
+            '/characters/',
+            params={'anime': next(anime), 'limit': PAGE_SIZE},
+            headers=headers[i % len(headers)],
+        )
+
+    async def clear_cache(i):
+        await get_response_cache().clear()
+
+    result, _ = await measure(
+        'list_characters_cached', requests, concurrency, list_characters
+    )
+    results.append(result)
+    result, _ = await measure(
+        'list_characters', requests, concurrency, list_characters, clear_cache
+    )
+    results.append(result)
+
+    def create_character(i):
+        return client.post(
+            '/characters/',
+            json={
+                'name': f'Benchmark {i}',
+                'age': 20,
+                'anime': next(anime),
+                'hierarchy': next(hierarchy),
+                'abilities': 'Velocidade',
+                'notable_moments': 'Apareceu no benchmark',
+            },
+            headers=headers[i % len(headers)],
+        )
+
+    result, responses = await measure(
+        'create_character', requests, concurrency, create_character
+    )
+    results.append(result)
+    # O personagem i pertence ao usuário i % len(headers), como na criação
+    created = [response.json()['id'] for response in responses]
+
+    def patch_character(i):
+        return client.patch(
+            f'/characters/{created[i]}',
+            json={'hierarchy': next(hierarchy)},
+            headers=headers[i % len(headers)],
+        )
+
+    def delete_character(i):
+        return client.delete(
+            f'/characters/{created[i]}', headers=headers[i % len(headers)]
+        )
+
+    result, _ = await measure(
+        'patch_character', requests, concurrency, patch_character
+    )
+    results.append(result)
+    result, _ = await measure(
+        'delete_character', requests, concurrency, delete_character
+    )
+    results.append(result)
+
+    return results
+
+
+@contextmanager
+def benchmark_database(url: str | None):
+    """URL do banco do benchmark; sem uma, sobe um Postgres descartável."""
+    if url:
+        yield url
+        return
+
+    with PostgresContainer('postgres:17', driver='psycopg') as postgres:
+        yield postgres.get_connection_url()
+
+
+def use_database(url: str):
+    # As configurações são lidas no primeiro uso, então basta trocar as
+    # variáveis antes de o app criar o engine e os caches
+    os.environ['DATABASE_URL'] = url
+    os.environ['DATABASE_REPLICA_URLS'] = '[]'
+    os.environ['CACHE_URL'] = ''
+    get_settings.cache_clear()
+
+
+async def run(args) -> dict:
+    engine = get_engine()
+    async with engine.begin() as conn:
+        tables = await conn.run_sync(
+            lambda sync_conn: inspect(sync_conn).get_table_names()
+        )
+        if tables:
+            # O fim do benchmark apaga as tabelas: só num banco vazio
+            raise SystemExit(
+                'The benchmark database must be empty, '
+                f'found tables: {", ".join(sorted(tables))}'
+            )
+        await conn.run_sync(table_registry.metadata.create_all)
+
+    try:
+        emails = await seed(args.users, args.characters)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url='http://benchmark'
+        ) as client:
+            results = await run_scenarios(
+                client, emails, args.requests, args.concurrency
+            )
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(table_registry.metadata.drop_all)
+        await engine.dispose()
+
+    return {
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'users': args.users,
+        'characters_per_user': args.characters,
+        'concurrency': args.concurrency,
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--characters', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument(
+        '--database-url', default=os.environ.get('BENCH_DATABASE_URL')
+    )
+    parser.add_argument('--output', type=argparse.FileType('w'))
+    args = parser.parse_args(argv)
+    # Cada usuário precisa de um login para ganhar o token dos outros cenários
+    if args.requests < max(args.users, 2):
+        parser.error('--requests must be at least --users (and 2)')
+
+    with benchmark_database(args.database_url) as url:
+        use_database(url)
+        report = asyncio.run(run(args))
+
+    output = args.output or sys.stdout
+    json.dump(report, output, indent=2)
+    output.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+"""Informações do repositório gravadas junto dos resultados."""
+
+import subprocess
+
+
+def current_commit() -> str | None:
+    try:
+        process = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+    except OSError:
+        return None
+    return process.stdout.strip() or None
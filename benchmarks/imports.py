@@ -0,0 +1,116 @@
+"""Benchmark do tempo de `import senpaisearch.app`.
+
+Cada medição roda num interpretador novo (nada em cache do processo) e
+cronometra só o import. Além do tempo, confere que importar o app não lê
+as configurações, não cria o engine nem o hasher e não carrega o driver do
+banco nem o numpy (do índice de parecidos): isso é trabalho do lifespan.
+Sai com erro se a mediana passar do orçamento ou se algum desses objetos
+for criado, para servir de verificação no CI.
+
+Uso: python -m benchmarks.imports [--runs N] [--budget-ms MS] [--top N]
+     [--output resultado.json]
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+
+from benchmarks.git import current_commit
+
+# Roda no interpretador filho; imprime o resultado como JSON
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import senpaisearch.app
+elapsed = time.perf_counter() - start
+from senpaisearch.database import get_engine
+from senpaisearch.security import get_password_context
+from senpaisearch.settings import get_settings
+print(json.dumps({
+    'milliseconds': elapsed * 1000,
+    'settings_created': get_settings.cache_info().currsize > 0,
+    'engine_created': get_engine.cache_info().currsize > 0,
+    'hasher_created': get_password_context.cache_info().currsize > 0,
+    'driver_loaded': 'psycopg' in sys.modules,
+    'numpy_loaded': 'numpy' in sys.modules,
+}))
+"""
+
+
+def run_child(*options: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *options, '-c', CHILD],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def slowest_modules(importtime: str, top: int) -> list[dict]:
+    """Módulos com maior tempo acumulado na saída de -X importtime."""
+    modules = []
+    for line in importtime.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.removeprefix('import time:').split('|')
+        modules.append({
+            'module': name.strip(),
+            'cumulative_ms': round(int(cumulative) / 1000, 1),
+        })
+
+    modules.sort(key=lambda module: module['cumulative_ms'], reverse=True)
+    return modules[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=1100)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--output', type=argparse.FileType('w'))
+    args = parser.parse_args(argv)
+
+    runs = [json.loads(run_child().stdout) for _ in range(args.runs)]
+    # O -X importtime atrasa o import, então só serve para o detalhamento
+    profile = run_child('-X', 'importtime')
+    median = statistics.median(run['milliseconds'] for run in runs)
+    created = [
+        key
+        for key in (
+            'settings_created',
+            'engine_created',
+            'hasher_created',
+            'driver_loaded',
+            'numpy_loaded',
+        )
+        if runs[0][key]
+    ]
+
+    report = {
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'runs': args.runs,
+        'budget_ms': args.budget_ms,
+        'import_ms': {
+            'min': round(min(run['milliseconds'] for run in runs), 1),
+            'median': round(median, 1),
+            'max': round(max(run['milliseconds'] for run in runs), 1),
+        },
+        'created_at_import': created,
+        'slowest_modules': slowest_modules(profile.stderr, args.top),
+    }
+
+    output = args.output or sys.stdout
+    json.dump(report, output, indent=2)
+    output.write('\n')
+
+    if median > args.budget_ms or created:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
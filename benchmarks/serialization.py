@@ -0,0 +1,101 @@
+"""Custo de serializar uma página da listagem de personagens.
+
+Compara o caminho antigo (entidades validadas por CharacterList e
+serializadas pelo Pydantic) com o atual (linhas como dicts direto no
+orjson). Não precisa de banco: as linhas são montadas em memória.
+
+Uso: python -m benchmarks.serialization [--repeat N] [tamanhos...]
+"""
+
+import argparse
+import json
+import sys
+import timeit
+
+import orjson
+
+from senpaisearch.models import Character
+from senpaisearch.schemas import CharacterList
+
+DEFAULT_PAGE_SIZES = (20, 100, 1000)
+
+
+def make_rows(count: int) -> list[dict]:
+    return [
+        {
+            'id': i,
+            'name': f'Personagem {i}',
+            'age': 17 + i % 40,
+            'anime': f'Anime {i % 50}',
+            'hierarchy': 'Hashira',
+            'abilities': 'Respiração da Água, Respiração do Sol',
+            'notable_moments': 'Derrotou um dos Doze Kizuki. ' * 4,
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def make_entities(rows: list[dict]) -> list[Character]:
+    entities = []
+    for row in rows:
+        fields = dict(row)
+        character_id = fields.pop('id')
+        character = Character(**fields, user_id=1)
+        character.id = character_id
+        entities.append(character)
+    return entities
+
+
+def serialize_validated(entities: list[Character]) -> bytes:
+    page = CharacterList.model_validate(
+        {'characters': entities, 'next_cursor': None}, from_attributes=True
+    )
+    return page.model_dump_json().encode()
+
+
+def serialize_rows(rows: list[dict]) -> bytes:
+    return orjson.dumps({'characters': rows, 'next_cursor': None})
+
+
+def measure(function, argument, repeat: int) -> float:
+    """Menor tempo médio por chamada, em microssegundos."""
+    timer = timeit.Timer(lambda: function(argument))
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number * 1_000_000
+
+
+def run(page_sizes, repeat: int) -> list[dict]:
+    results = []
+    for size in page_sizes:
+        rows = make_rows(size)
+        entities = make_entities(rows)
+        # Os dois caminhos precisam produzir o mesmo documento
+        assert json.loads(serialize_validated(entities)) == json.loads(
+            serialize_rows(rows)
+        )
+
+        before = measure(serialize_validated, entities, repeat)
+        after = measure(serialize_rows, rows, repeat)
+        results.append({
+            'page_size': size,
+            'validated_us': round(before, 1),
+            'orjson_us': round(after, 1),
+            'speedup': round(before / after, 1),
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('page_sizes', nargs='*', type=int)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = run(args.page_sizes or DEFAULT_PAGE_SIZES, args.repeat)
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
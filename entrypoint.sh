@@ -3,5 +3,5 @@
 # Executa as migrações do banco de dados
 poetry run alembic upgrade head
 
-# Inicia a aplicação
-poetry run uvicorn --host 0.0.0.0 --port 8000 senpaisearch.app:app
\ No newline at end of file
+# Inicia a aplicação (exec: o servidor recebe o SIGTERM do container)
+exec poetry run senpaisearch-serve
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""add characters search vector
+
+Revision ID: 3f9c2d7a1b84
+Revises: 0e6b039fec49
+Create Date: 2026-10-18 09:12:41.208315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c2d7a1b84'
+down_revision: Union[str, None] = '0e6b039fec49'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_VECTOR_EXPRESSION = (
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(anime, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(hierarchy, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(abilities, '')), 'C') || "
+    "setweight(to_tsvector('simple', coalesce(notable_moments, '')), 'D')"
+)
+
+
+def upgrade() -> None:
+    op.add_column('characters', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(SEARCH_VECTOR_EXPRESSION, persisted=True),
+        nullable=True,
+    ))
+    op.create_index(
+        'ix_characters_search_vector',
+        'characters',
+        ['search_vector'],
+        unique=False,
+        postgresql_using='gin',
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        'ix_characters_search_vector',
+        table_name='characters',
+        postgresql_using='gin',
+    )
+    op.drop_column('characters', 'search_vector')
@@ -0,0 +1,42 @@
+"""add characters trigram indexes
+
+Revision ID: 8b41e6c05d2f
+Revises: 3f9c2d7a1b84
+Create Date: 2026-10-18 10:47:05.613904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b41e6c05d2f'
+down_revision: Union[str, None] = '3f9c2d7a1b84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index(
+        'ix_characters_name_trgm',
+        'characters',
+        ['name'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'},
+    )
+    op.create_index(
+        'ix_characters_anime_trgm',
+        'characters',
+        ['anime'],
+        unique=False,
+        postgresql_using='gin',
+        postgresql_ops={'anime': 'gin_trgm_ops'},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_characters_anime_trgm', table_name='characters')
+    op.drop_index('ix_characters_name_trgm', table_name='characters')
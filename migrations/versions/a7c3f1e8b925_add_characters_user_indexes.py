@@ -0,0 +1,50 @@
+"""add characters user indexes
+
+Revision ID: a7c3f1e8b925
+Revises: d52a7e9c31f0
+Create Date: 2026-10-18 16:22:47.901456
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3f1e8b925'
+down_revision: Union[str, None] = 'd52a7e9c31f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# users.email não precisa de índice novo: a UNIQUE constraint já cria um
+INDEXES = {
+    'ix_characters_user_id_id': ['user_id', 'id'],
+    'ix_characters_user_id_anime': ['user_id', 'anime'],
+    'ix_characters_user_id_hierarchy': ['user_id', 'hierarchy'],
+}
+
+
+def upgrade() -> None:
+    # CONCURRENTLY não bloqueia escritas na tabela, mas não pode rodar
+    # dentro de uma transação
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(
+                name,
+                'characters',
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(
+                name,
+                table_name='characters',
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
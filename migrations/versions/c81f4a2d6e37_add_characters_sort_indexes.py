@@ -0,0 +1,48 @@
+"""add characters sort indexes
+
+Revision ID: c81f4a2d6e37
+Revises: a7c3f1e8b925
+Create Date: 2026-10-18 19:05:12.318804
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81f4a2d6e37'
+down_revision: Union[str, None] = 'a7c3f1e8b925'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    'ix_characters_user_id_name': ['user_id', 'name'],
+    'ix_characters_user_id_age_id': ['user_id', 'age', 'id'],
+}
+
+
+def upgrade() -> None:
+    # CONCURRENTLY não bloqueia escritas na tabela, mas não pode rodar
+    # dentro de uma transação
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(
+                name,
+                'characters',
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(
+                name,
+                table_name='characters',
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
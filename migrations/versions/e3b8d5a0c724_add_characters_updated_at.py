@@ -0,0 +1,52 @@
+"""add characters updated_at
+
+Revision ID: e3b8d5a0c724
+Revises: c81f4a2d6e37
+Create Date: 2026-10-18 21:12:40.518270
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b8d5a0c724'
+down_revision: Union[str, None] = 'c81f4a2d6e37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Com um default estável como now() o Postgres não reescreve a tabela:
+    # as linhas existentes recebem o horário da migração
+    op.add_column(
+        'characters',
+        sa.Column(
+            'updated_at',
+            sa.DateTime(),
+            server_default=sa.text('now()'),
+            nullable=False,
+        ),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_characters_updated_at',
+            'characters',
+            ['updated_at'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_characters_updated_at',
+            table_name='characters',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column('characters', 'updated_at')
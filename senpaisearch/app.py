@@ -1,17 +1,54 @@
+from contextlib import asynccontextmanager
 from http import HTTPStatus
+from importlib import import_module
 
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 
-from senpaisearch.routers import auth, characters, users
+from senpaisearch.autocomplete import get_autocomplete_index
+from senpaisearch.cache import get_response_cache
+from senpaisearch.database import (
+    dispose_engines,
+    get_engine,
+    get_recent_writers,
+    get_replicas,
+)
+from senpaisearch.metrics import MetricsMiddleware
+from senpaisearch.routers import auth, characters, health, metrics, users
 from senpaisearch.schemas import Message
+from senpaisearch.security import get_password_context, get_principal_cache
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Engine, hasher e caches nascem na subida de cada worker, não na
+    # importação: assim importar o app (CLI, Alembic, o processo principal
+    # do senpaisearch-serve) não lê o .env, não carrega o driver nem abre
+    # pools ou conexões com o Redis
+    get_engine()
+    get_replicas()
+    get_recent_writers()
+    get_password_context()
+    get_principal_cache()
+    get_autocomplete_index()
+    get_response_cache()
+    # numpy e scipy (~200 ms) também ficam fora da importação do app; o
+    # índice de parecidos é carregado aqui, antes da primeira requisição
+    import_module('senpaisearch.similarity')
+    yield
+    await dispose_engines()
+
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(users.router)
 app.include_router(auth.router)
 app.include_router(characters.router)
+app.include_router(health.router)
+app.include_router(metrics.router)
 
 
 @app.get('/', status_code=HTTPStatus.OK, response_model=Message)
-def read_root():
+async def read_root():
     return {'message': 'Olá mundo!'}
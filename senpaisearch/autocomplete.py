@@ -0,0 +1,201 @@
+import asyncio
+import unicodedata
+from bisect import bisect_left, insort
+from functools import lru_cache
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from senpaisearch.cache import TTLCache
+from senpaisearch.models import Character
+from senpaisearch.settings import get_settings
+
+
+def normalize(text: str) -> str:
+    # Sem acentos e sem caixa: "capitao" encontra "Capitão"
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class PrefixIndex:
+    """Textos ordenados para busca por prefixo com bisect.
+
+    Cada texto entra uma vez por palavra (a partir do início dela), então
+    "uzu" também encontra "Naruto Uzumaki". Textos repetidos são contados
+    e só saem do índice quando a última ocorrência é removida.
+    """
+
+    def __init__(self):
+        self._entries: list[tuple[str, str]] = []
+        self._counts: dict[str, int] = {}
+
+    @classmethod
+    def from_texts(cls, texts) -> 'PrefixIndex':
+        # Em lote: um sort só, em vez de um insort (O(n)) por chave
+        index = cls()
+        for text in texts:
+            index._counts[text] = index._counts.get(text, 0) + 1
+        index._entries = sorted(
+            (key, text) for text in index._counts for key in cls._keys(text)
+        )
+        return index
+
+    @staticmethod
+    def _keys(text: str):
+        words = normalize(text).split()
+        return {' '.join(words[i:]) for i in range(len(words))}
+
+    def add(self, text: str):
+        self._counts[text] = self._counts.get(text, 0) + 1
+        if self._counts[text] == 1:
+            for key in self._keys(text):
+                insort(self._entries, (key, text))
+
+    def remove(self, text: str):
+        count = self._counts.get(text, 0)
+        if count > 1:
+            self._counts[text] = count - 1
+            return
+
+        self._counts.pop(text, None)
+        for key in self._keys(text):
+            position = bisect_left(self._entries, (key, text))
+            if self._entries[position : position + 1] == [(key, text)]:
+                del self._entries[position]
+
+    def search(self, prefix: str, limit: int) -> list[str]:
+        # O(log n) até o primeiro candidato; depois só os k resultados
+        prefix = normalize(prefix).strip()
+        results = {}
+        position = bisect_left(self._entries, (prefix,))
+        while len(results) < limit and position < len(self._entries):
+            key, text = self._entries[position]
+            if not key.startswith(prefix):
+                break
+            results[text] = None
+            position += 1
+
+        return list(results)
+
+
+class UserSuggestions:
+    """Nomes e animes dos personagens de um usuário."""
+
+    def __init__(self):
+        self.characters: dict[int, tuple[str, str]] = {}
+        self.names = PrefixIndex()
+        self.anime = PrefixIndex()
+
+    @classmethod
+    def from_rows(cls, rows) -> 'UserSuggestions':
+        """Monta o índice de uma vez a partir de (id, nome, anime)."""
+        suggestions = cls()
+        suggestions.characters = {
+            character_id: (name, anime) for character_id, name, anime in rows
+        }
+        characters = suggestions.characters.values()
+        suggestions.names = PrefixIndex.from_texts(
+            name for name, _ in characters
+        )
+        suggestions.anime = PrefixIndex.from_texts(
+            anime for _, anime in characters
+        )
+        return suggestions
+
+    def add(self, character_id: int, name: str, anime: str):
+        self.remove(character_id)
+        self.characters[character_id] = (name, anime)
+        self.names.add(name)
+        self.anime.add(anime)
+
+    def remove(self, character_id: int):
+        old = self.characters.pop(character_id, None)
+        if old:
+            self.names.remove(old[0])
+            self.anime.remove(old[1])
+
+
+class AutocompleteIndex:
+    """Índice em memória (por worker) para as sugestões da busca.
+
+    O índice de cada usuário é montado do banco no primeiro pedido e
+    atualizado pelas escritas feitas neste worker. Escritas feitas em
+    outro worker aparecem quando a entrada expira (ttl) e é remontada.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._users = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Escritas feitas enquanto o índice do usuário está sendo montado,
+        # uma lista por montagem em andamento; None manda descartar
+        self._journals: dict[int, list[list]] = {}
+
+    async def get(
+        self, session: AsyncSession, user_id: int
+    ) -> UserSuggestions:
+        suggestions = self._users.get(user_id)
+        if suggestions is not None:
+            return suggestions
+
+        journal = []
+        self._journals.setdefault(user_id, []).append(journal)
+        try:
+            result = await session.execute(
+                select(Character.id, Character.name, Character.anime).where(
+                    Character.user_id == user_id
+                )
+            )
+            rows = result.all()
+            # Montar o índice de milhares de personagens gasta CPU: fora do
+            # event loop, para não travar as outras requisições do worker
+            suggestions = await asyncio.get_running_loop().run_in_executor(
+                None, UserSuggestions.from_rows, rows
+            )
+        finally:
+            journals = self._journals[user_id]
+            journals.remove(journal)
+            if not journals:
+                del self._journals[user_id]
+
+        # O que foi escrito durante a montagem pode não estar nas linhas lidas
+        for entry in journal:
+            if entry is None:
+                return suggestions
+            method, *args = entry
+            getattr(suggestions, method)(*args)
+
+        self._users.set(user_id, suggestions)
+        return suggestions
+
+    def _record(self, user_id: int, entry):
+        for journal in self._journals.get(user_id, ()):
+            journal.append(entry)
+
+    def save(self, user_id: int, character_id: int, name: str, anime: str):
+        # Usuário ainda não carregado: a próxima carga já lê do banco
+        suggestions = self._users.get(user_id)
+        if suggestions is not None:
+            suggestions.add(character_id, name, anime)
+        self._record(user_id, ('add', character_id, name, anime))
+
+    def remove(self, user_id: int, character_id: int):
+        suggestions = self._users.get(user_id)
+        if suggestions is not None:
+            suggestions.remove(character_id)
+        self._record(user_id, ('remove', character_id))
+
+    def forget(self, user_id: int):
+        # Para escritas em lote: mais simples remontar do que aplicar uma a uma
+        self._users.delete(user_id)
+        self._record(user_id, None)
+
+    def clear(self):
+        self._users.clear()
+
+
+@lru_cache
+def get_autocomplete_index() -> AutocompleteIndex:
+    settings = get_settings()
+    return AutocompleteIndex(
+        maxsize=settings.AUTOCOMPLETE_MAXSIZE,
+        ttl=settings.AUTOCOMPLETE_TTL_SECONDS,
+    )
@@ -0,0 +1,196 @@
+import codecs
+import csv
+import json
+from typing import AsyncIterator
+
+from pydantic import ValidationError
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from senpaisearch.models import Character
+from senpaisearch.schemas import CharacterCreate
+
+# Linhas validadas e inseridas por comando INSERT (e por commit)
+IMPORT_CHUNK_SIZE = 1000
+# Quantos erros detalhados a resposta carrega; o total vem em "failed"
+MAX_REPORTED_ERRORS = 1000
+# Linhas (e registros CSV de várias linhas) maiores que isso viram erro
+MAX_LINE_SIZE = 1024 * 1024
+
+
+def _line(text: str) -> str | None:
+    return text.removesuffix('\r') if len(text) <= MAX_LINE_SIZE else None
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]):
+    """Quebra o corpo da requisição em linhas conforme ele chega.
+
+    Uma linha com mais de MAX_LINE_SIZE caracteres não fica na memória: no
+    lugar dela vem None e o resto dela é descartado até a próxima quebra.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer = ''
+    skipping = False
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            if skipping:
+                # Final da linha longa demais, já reportada
+                skipping = False
+                continue
+            yield _line(line)
+        if len(buffer) > MAX_LINE_SIZE:
+            if not skipping:
+                yield None
+            skipping, buffer = True, ''
+
+    buffer += decoder.decode(b'', final=True)
+    if buffer and not skipping:
+        yield _line(buffer)
+
+
+async def iter_ndjson_records(lines: AsyncIterator[str]):
+    """Gera (número da linha, objeto ou mensagem de erro) para NDJSON."""
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if line is None:
+            yield line_number, 'Line too long'
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_number, 'Invalid JSON'
+            continue
+        if not isinstance(record, dict):
+            yield line_number, 'Expected a JSON object'
+            continue
+        yield line_number, record
+
+
+async def iter_csv_records(lines: AsyncIterator[str]):
+    """Gera (número da linha, objeto) para CSV com cabeçalho.
+
+    Um campo entre aspas pode conter quebras de linha, então as linhas são
+    juntadas até o número de aspas ficar par (aspas escapadas vêm em pares).
+    """
+    header = None
+    line_number = 0
+    record, record_line = '', 0
+    async for line in lines:
+        line_number += 1
+        if line is None:
+            # Um campo entre aspas aberto antes da linha longa se perde junto
+            yield record_line if record else line_number, 'Line too long'
+            record = ''
+            continue
+        if not record:
+            record_line = line_number
+            record = line
+        else:
+            record += '\n' + line
+        if len(record) > MAX_LINE_SIZE:
+            yield record_line, 'Record too long'
+            record = ''
+            continue
+        if record.count('"') % 2:
+            continue
+
+        row, record = next(csv.reader([record]), []), ''
+        if not any(row):
+            continue
+        if header is None:
+            header = [column.strip() for column in row]
+            continue
+        # Campos vazios ficam de fora para valerem os padrões do schema
+        fields = {column: value for column, value in zip(header, row) if value}
+        yield record_line, fields
+
+    if record:
+        yield record_line, 'Unterminated quoted field'
+
+
+def _validation_message(error: ValidationError) -> str:
+    return '; '.join(
+        f'{".".join(map(str, item["loc"]))}: {item["msg"]}'
+        for item in error.errors()
+    )
+
+
+async def import_characters(
+    session: AsyncSession, user_id: int, records
+) -> dict:
+    """Valida e insere os personagens em lotes de IMPORT_CHUNK_SIZE.
+
+    Linhas inválidas ou com nome repetido entram no relatório de erros sem
+    interromper a importação; cada lote é confirmado separadamente, então
+    a memória usada não depende do tamanho do arquivo.
+    """
+    report = {'imported': 0, 'failed': 0, 'errors': []}
+
+    def fail(line: int, detail: str):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line, 'detail': detail})
+
+    async def flush(chunk):
+        duplicated = await _insert_chunk(session, user_id, chunk)
+        report['imported'] += len(chunk) - len(duplicated)
+        for line in duplicated:
+            fail(line, 'Character name already exists')
+
+    chunk = []
+    async for line, record in records:
+        if isinstance(record, str):
+            fail(line, record)
+            continue
+        try:
+            character = CharacterCreate.model_validate(record)
+        except ValidationError as error:
+            fail(line, _validation_message(error))
+            continue
+
+        chunk.append((line, character))
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            await flush(chunk)
+            chunk = []
+
+    if chunk:
+        await flush(chunk)
+
+    # Nomes repetidos só são descobertos no INSERT, depois dos outros erros
+    report['errors'].sort(key=lambda error: error['line'])
+    return report
+
+
+async def _insert_chunk(session: AsyncSession, user_id: int, chunk) -> list:
+    """Insere o lote e devolve as linhas que não entraram por nome repetido.
+
+    É um único INSERT ... ON CONFLICT DO NOTHING RETURNING por lote: os
+    nomes que não voltam já existiam (o nome é único).
+    """
+    inserted = set(
+        await session.scalars(
+            insert(Character)
+            .values([
+                {**character.model_dump(), 'user_id': user_id}
+                for _, character in chunk
+            ])
+            .on_conflict_do_nothing(index_elements=['name'])
+            .returning(Character.name)
+        )
+    )
+    await session.commit()
+
+    duplicated = []
+    for line, character in chunk:
+        if character.name in inserted:
+            # Só a primeira ocorrência de um nome repetido no lote entra
+            inserted.discard(character.name)
+        else:
+            duplicated.append(line)
+
+    return duplicated
@@ -0,0 +1,199 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from http import HTTPStatus
+
+from fastapi import Request, Response
+
+from senpaisearch.settings import Settings, get_settings
+
+
+class TTLCache:
+    """Cache LRU em memória em que cada item expira após `ttl` segundos.
+
+    Não é thread-safe: é feito para ser usado a partir do event loop.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        item = self._items.get(key)
+        if item is None:
+            return default
+
+        value, expires_at = item
+        if expires_at <= time.monotonic():
+            del self._items[key]
+            return default
+
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float | None = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._items[key] = (value, expires_at)
+        self._items.move_to_end(key)
+
+        # Descarta os itens usados há mais tempo
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def delete(self, key):
+        self._items.pop(key, None)
+
+    def clear(self):
+        self._items.clear()
+
+
+class MemoryBackend:
+    """Backend padrão: um TTLCache local do worker."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._items = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> bytes | None:
+        return self._items.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        self._items.set(key, value, ttl)
+
+    async def clear(self):
+        self._items.clear()
+
+
+class RedisBackend:
+    """Backend compartilhado entre workers.
+
+    Aceita qualquer cliente com a interface assíncrona do redis-py (get/set
+    com `ex`, scan_iter e delete), como um Valkey/KeyDB ou o fakeredis nos
+    testes. Todas as chaves levam `prefix`, já que o banco do Redis pode
+    ser compartilhado com outros serviços.
+    """
+
+    # Chaves apagadas por comando no clear()
+    DELETE_BATCH = 500
+
+    def __init__(self, client, prefix: str = 'senpaisearch:cache:'):
+        self._client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = 'senpaisearch:cache:'):
+        # O redis é uma dependência opcional: poetry install -E redis
+        from redis.asyncio import Redis  # noqa: PLC0415
+
+        return cls(Redis.from_url(url), prefix)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        await self._client.set(self.prefix + key, value, ex=ttl)
+
+    async def clear(self):
+        # SCAN em vez de FLUSHDB, que apagaria também as chaves dos outros;
+        # o prefixo é escapado para valer como texto no padrão do MATCH
+        pattern = re.sub(r'([*?\[\]\\])', r'\\\1', self.prefix) + '*'
+        keys = []
+        async for key in self._client.scan_iter(
+            match=pattern, count=self.DELETE_BATCH
+        ):
+            keys.append(key)
+            if len(keys) >= self.DELETE_BATCH:
+                await self._client.delete(*keys)
+                keys.clear()
+        if keys:
+            await self._client.delete(*keys)
+
+
+class ResponseCache:
+    """Cache de respostas agrupadas por namespace (ex.: personagens de um
+    usuário).
+
+    Cada namespace tem uma versão guardada no próprio backend e que faz
+    parte da chave das respostas. Invalidar troca a versão, então todas as
+    respostas antigas do namespace deixam de ser encontradas de uma vez e
+    expiram sozinhas pelo TTL.
+    """
+
+    def __init__(self, backend, ttl: int, version_ttl: int = 86_400):
+        self.backend = backend
+        self.ttl = ttl
+        self.version_ttl = version_ttl
+
+    async def _version(self, namespace: str) -> str:
+        version = await self.backend.get(f'{namespace}:version')
+        if version is None:
+            # Uma versão nova nunca repete uma antiga, mesmo que a chave da
+            # versão tenha sido descartada pelo backend
+            return await self.invalidate(namespace)
+        return version.decode() if isinstance(version, bytes) else version
+
+    async def key(self, namespace: str, params: str) -> str:
+        """Chave das respostas de `params` na versão atual do namespace.
+
+        Deve ser obtida antes da consulta ao banco: se houver uma escrita
+        no meio do caminho, a resposta é salva na versão antiga e não é
+        servida de novo.
+        """
+        digest = hashlib.blake2b(params.encode(), digest_size=16).hexdigest()
+        return f'{namespace}:{await self._version(namespace)}:{digest}'
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.backend.get(key)
+
+    async def set(self, key: str, body: bytes):
+        await self.backend.set(key, body, self.ttl)
+
+    async def invalidate(self, namespace: str) -> str:
+        version = str(time.time_ns())
+        await self.backend.set(
+            f'{namespace}:version', version.encode(), self.version_ttl
+        )
+        return version
+
+    async def clear(self):
+        await self.backend.clear()
+
+
+def create_response_cache(settings: Settings) -> ResponseCache:
+    if not settings.CACHE_ENABLED:
+        # Sem espaço para nenhum item: cada set é descartado na hora
+        backend = MemoryBackend(maxsize=0, ttl=settings.CACHE_TTL_SECONDS)
+    elif settings.CACHE_URL:
+        backend = RedisBackend.from_url(settings.CACHE_URL)
+    else:
+        backend = MemoryBackend(
+            maxsize=settings.CACHE_MAXSIZE, ttl=settings.CACHE_TTL_SECONDS
+        )
+
+    return ResponseCache(backend, ttl=settings.CACHE_TTL_SECONDS)
+
+
+def json_response(request: Request, body: bytes) -> Response:
+    """Responde o JSON já serializado com ETag, ou 304 se o cliente já tem
+    essa versão (If-None-Match)."""
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    # no-cache: o cliente pode guardar, mas deve revalidar com o ETag
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+    if_none_match = request.headers.get('if-none-match', '')
+    if etag in {tag.strip() for tag in if_none_match.split(',')}:
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+
+    return Response(body, media_type='application/json', headers=headers)
+
+
+# Criado no primeiro uso (o lifespan do app faz isso), não na importação:
+# com CACHE_URL o cliente do Redis só nasce na subida do worker
+@lru_cache
+def get_response_cache() -> ResponseCache:
+    return create_response_cache(get_settings())
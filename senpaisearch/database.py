@@ -1,11 +1,421 @@
-from sqlalchemy import create_engine
+import logging
+import math
+import re
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import count
+
+from sqlalchemy import Engine, event, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+)
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool, Pool
+from sqlalchemy.sql.dml import UpdateBase
+
+from senpaisearch.cache import MemoryBackend, RedisBackend
+from senpaisearch.settings import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+# Comandos que o EXPLAIN aceita; sem ANALYZE eles não são executados
+EXPLAINABLE = re.compile(r'\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b', re.I)
+
+
+def engine_options(settings: Settings) -> dict:
+    connect_args = {}
+
+    if settings.DB_EXTERNAL_POOLER:
+        # Em modo transaction o PgBouncer troca a conexão do servidor entre
+        # transações: o pool local só atrapalha e prepared statements do
+        # psycopg podem cair em outra conexão. O PgBouncer também recusa o
+        # parâmetro "options", então o statement_timeout deve ser definido
+        # no próprio papel (ALTER ROLE ... SET statement_timeout).
+        connect_args['prepare_threshold'] = None
+        return {'poolclass': NullPool, 'connect_args': connect_args}
+
+    if settings.DB_STATEMENT_TIMEOUT_MS:
+        connect_args['options'] = (
+            f'-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}'
+        )
+
+    return {
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'pool_pre_ping': settings.DB_POOL_PRE_PING,
+        'connect_args': connect_args,
+    }
+
+
+def pool_status(pool: Pool) -> dict:
+    status = {'pool_class': type(pool).__name__}
+
+    # NullPool não mantém conexões, então não tem contadores
+    if hasattr(pool, 'checkedout'):
+        status.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+
+    return status
+
+
+@dataclass(slots=True)
+class QueryStats:
+    count: int = 0
+    duration: float = 0.0  # Segundos somados de todas as consultas
+
+
+# Contagem da requisição atual; o middleware de métricas instala uma nova
+# a cada requisição e os eventos do engine só somam quando há uma
+query_stats: ContextVar[QueryStats | None] = ContextVar(
+    'query_stats', default=None
+)
+
+
+def explain(conn, statement: str, parameters) -> str:
+    """Plano da consulta, pedido na mesma conexão e transação dela.
+
+    Roda dentro de um SAVEPOINT: se o EXPLAIN falhar, a transação da
+    requisição continua válida.
+    """
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute('SAVEPOINT explain_slow_query')
+        try:
+            cursor.execute(f'EXPLAIN {statement}', parameters)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        except Exception as error:
+            cursor.execute('ROLLBACK TO SAVEPOINT explain_slow_query')
+            plan = f'(EXPLAIN failed: {error})'
+        cursor.execute('RELEASE SAVEPOINT explain_slow_query')
+    finally:
+        cursor.close()
+
+    return plan
+
+
+def track_queries(sync_engine: Engine, slow_query_ms: int = 0):
+    """Soma cada consulta do engine no QueryStats da requisição atual.
+
+    Com slow_query_ms, consultas mais lentas que isso vão para o log com o
+    plano de execução.
+    """
+
+    @event.listens_for(sync_engine, 'before_cursor_execute', named=True)
+    def before_cursor_execute(conn, **kw):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, 'after_cursor_execute', named=True)
+    def after_cursor_execute(conn, statement, parameters, executemany, **kw):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        stats = query_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.duration += elapsed
+
+        if not slow_query_ms or elapsed * 1000 < slow_query_ms:
+            return
+        # Num executemany não há um único conjunto de parâmetros para o plano
+        if executemany or not EXPLAINABLE.match(statement):
+            plan = '(no plan)'
+        else:
+            plan = explain(conn, statement, parameters)
+        logger.warning(
+            'Slow query (%.1f ms): %s\n%s', elapsed * 1000, statement, plan
+        )
+
+
+# Usuário autenticado na requisição atual e se ele escreveu no primário há
+# pouco (definidos em set_request_user, antes das consultas da requisição)
+request_user: ContextVar[int | None] = ContextVar('request_user', default=None)
+recent_writer: ContextVar[bool] = ContextVar('recent_writer', default=False)
+# Autores de escritas recentes guardados em memória (sem CACHE_URL)
+RECENT_WRITERS_MAXSIZE = 100_000
+
+
+def _in_use(engine: AsyncEngine) -> int:
+    # NullPool não conta conexões: as réplicas ficam só no rodízio
+    return pool_status(engine.pool).get('checked_out', 0)
+
+
+class ReplicaSet:
+    """Réplicas de leitura e quais delas estão fora do ar.
+
+    A escolhida é a com menos conexões em uso, em rodízio no empate. Uma
+    réplica que falha ao conectar fica de fora por `retry_after` segundos
+    e depois volta a ser tentada.
+    """
+
+    def __init__(self, engines: list[AsyncEngine], retry_after: float):
+        self.engines = engines
+        self.retry_after = retry_after
+        self._down_until: dict[AsyncEngine, float] = {}
+        self._turn = count()
+
+    def available(self) -> list[AsyncEngine]:
+        now = time.monotonic()
+        return [
+            engine
+            for engine in self.engines
+            if self._down_until.get(engine, 0) <= now
+        ]
+
+    def choose(self) -> AsyncEngine | None:
+        engines = self.available()
+        if not engines:
+            return None
+
+        start = next(self._turn) % len(engines)
+        return min(engines[start:] + engines[:start], key=_in_use)
+
+    def mark_down(self, engine: AsyncEngine):
+        self._down_until[engine] = time.monotonic() + self.retry_after
+        logger.warning('Read replica %s is unavailable', engine.url.host)
+
+    def mark_up(self, engine: AsyncEngine):
+        self._down_until.pop(engine, None)
+
+    async def check(self) -> list[dict]:
+        """Testa cada réplica com um SELECT 1 e atualiza quais estão fora."""
+        statuses = []
+        for engine in self.engines:
+            try:
+                async with engine.connect() as conn:
+                    await conn.execute(select(1))
+            except (DBAPIError, OSError):
+                self.mark_down(engine)
+                status = 'unavailable'
+            else:
+                self.mark_up(engine)
+                status = 'ok'
 
-from senpaisearch.settings import Settings
+            statuses.append({
+                'host': engine.url.host,
+                'status': status,
+                'pool': pool_status(engine.pool),
+            })
 
-engine = create_engine(Settings().DATABASE_URL)
+        return statuses
 
 
-def get_session():  # pragma: no cover
-    with Session(engine) as session:
+class RecentWriters:
+    """Usuários que escreveram no primário há pouco.
+
+    Ficam num backend do cache: com CACHE_URL (Redis) a marca vale para
+    todos os workers e instâncias do app, então a leitura seguinte do
+    usuário vai ao primário qualquer que seja o worker que a receba. Sem
+    CACHE_URL ela é só deste processo, e o senpaisearch-serve recusa
+    réplicas com mais de um worker.
+    """
+
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = math.ceil(ttl)  # O Redis só aceita segundos inteiros
+
+    async def remember(self, user_id: int):
+        await self.backend.set(f'writer:{user_id}', b'1', self.ttl)
+
+    async def contains(self, user_id: int) -> bool:
+        return await self.backend.get(f'writer:{user_id}') is not None
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_statement_writes(orm_execute_state):
+    if (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush_writes(session, flush_context):
+    session.info['wrote'] = True
+
+
+class PrimarySession(AsyncSession):
+    """Sessão das rotas de escrita, sempre no primário.
+
+    Ao confirmar uma escrita, registra o usuário da requisição como autor
+    recente: por DB_REPLICA_STICKY_SECONDS as leituras dele vão ao
+    primário, e ele não deixa de ver a própria escrita numa réplica
+    atrasada.
+    """
+
+    async def commit(self):
+        await super().commit()
+        wrote = self.info.pop('wrote', False)
+        user_id = request_user.get()
+        if (
+            wrote
+            and user_id is not None
+            and get_settings().DATABASE_REPLICA_URLS
+        ):
+            recent_writer.set(True)
+            await get_recent_writers().remember(user_id)
+
+
+async def set_request_user(user_id: int):
+    """Define o usuário da requisição, antes de qualquer consulta dela."""
+    request_user.set(user_id)
+    if get_settings().DATABASE_REPLICA_URLS:
+        recent_writer.set(await get_recent_writers().contains(user_id))
+
+
+def connection_failed(error: DBAPIError) -> bool:
+    # Sem SQLSTATE o erro é da conexão (recusada, caiu), não do comando
+    return getattr(error.orig, 'sqlstate', None) is None
+
+
+class RoutingSession(Session):
+    """Sessão que lê de uma réplica e escreve no primário (o bind).
+
+    A réplica é escolhida no primeiro comando e mantida até o fim da
+    sessão. Vão para o primário: escritas e tudo que vier depois delas,
+    usuários que escreveram há pouco e sessões sem réplica disponível.
+    Se a réplica escolhida não conecta, ela sai do rodízio e a sessão
+    segue no primário, sem erro para a requisição.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if isinstance(clause, UpdateBase) or self._flushing:
+            self.info['replica'] = None
+        elif 'replica' not in self.info:
+            self.info['replica'] = (
+                None if recent_writer.get() else get_replicas().choose()
+            )
+
+        if self.info['replica'] is None:
+            return super().get_bind(mapper, clause=clause, **kw)
+        return self.info['replica'].sync_engine
+
+    def _connection_for_bind(self, engine, execution_options=None, **kw):
+        # Toda conexão da sessão é aberta aqui (get_bind só escolhe o banco)
+        replica = self.info.get('replica')
+        try:
+            return super()._connection_for_bind(
+                engine, execution_options, **kw
+            )
+        except DBAPIError as error:
+            if (
+                replica is None
+                or engine is not replica.sync_engine
+                or not connection_failed(error)
+            ):
+                raise
+            get_replicas().mark_down(replica)
+            self.info['replica'] = None
+            return super()._connection_for_bind(
+                self.bind, execution_options, **kw
+            )
+
+
+@lru_cache
+def get_recent_writers() -> RecentWriters:
+    settings = get_settings()
+    if settings.CACHE_URL:
+        backend = RedisBackend.from_url(
+            settings.CACHE_URL, prefix='senpaisearch:writers:'
+        )
+    else:
+        backend = MemoryBackend(
+            maxsize=RECENT_WRITERS_MAXSIZE,
+            ttl=settings.DB_REPLICA_STICKY_SECONDS,
+        )
+
+    return RecentWriters(backend, ttl=settings.DB_REPLICA_STICKY_SECONDS)
+
+
+# Engines criados no primeiro uso (o lifespan do app faz isso na subida de
+# cada worker), não na importação: importar o app não carrega o driver nem
+# abre pools, e um pool nunca atravessa o fork dos workers
+@lru_cache
+def get_engine() -> AsyncEngine:
+    settings = get_settings()
+    engine = create_async_engine(
+        settings.DATABASE_URL, **engine_options(settings)
+    )
+    track_queries(engine.sync_engine, settings.DB_SLOW_QUERY_MS)
+
+    return engine
+
+
+@lru_cache
+def get_replicas() -> ReplicaSet:
+    settings = get_settings()
+    engines = [
+        create_async_engine(url, **engine_options(settings))
+        for url in settings.DATABASE_REPLICA_URLS
+    ]
+    for engine in engines:
+        track_queries(engine.sync_engine, settings.DB_SLOW_QUERY_MS)
+
+    return ReplicaSet(engines, retry_after=settings.DB_REPLICA_RETRY_SECONDS)
+
+
+async def dispose_engines():
+    """Fecha as conexões dos pools (no fim do lifespan)."""
+    for engine in (get_engine(), *get_replicas().engines):
+        await engine.dispose()
+
+
+@asynccontextmanager
+async def read_connection(session: AsyncSession, clause):
+    """Conexão própria para uma leitura, no banco que a sessão usaria.
+
+    Para leituras que continuam depois de a sessão fechar, como uma
+    resposta em streaming. Com RoutingSession é a réplica escolhida por
+    ela; se essa réplica não conecta, a leitura vai para o primário.
+    """
+    session.sync_session.get_bind(clause=clause)
+    replica = session.info.get('replica')
+    conn = None
+    if replica is not None:
+        try:
+            conn = await replica.connect().start()
+        except DBAPIError as error:
+            if not connection_failed(error):
+                raise
+            get_replicas().mark_down(replica)
+    if conn is None:
+        conn = await session.bind.connect().start()
+
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
+async def get_session():  # pragma: no cover
+    async with PrimarySession(get_engine(), expire_on_commit=False) as session:
         yield session
+
+
+async def get_read_session():  # pragma: no cover
+    """Sessão para rotas só de leitura: usa uma réplica, se houver."""
+    async with AsyncSession(
+        get_engine(),
+        expire_on_commit=False,
+        sync_session_class=RoutingSession,
+    ) as session:
+        try:
+            yield session
+        except DBAPIError as error:
+            # A conexão caiu no meio da requisição (uma que não abre já foi
+            # trocada pelo primário): a réplica sai do rodízio por um tempo
+            replica = session.info.get('replica')
+            if replica and connection_failed(error):
+                get_replicas().mark_down(replica)
+            raise
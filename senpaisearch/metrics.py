@@ -0,0 +1,163 @@
+import os
+import time
+from http import HTTPStatus
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from starlette.datastructures import MutableHeaders
+
+from senpaisearch.database import (
+    QueryStats,
+    get_engine,
+    pool_status,
+    query_stats,
+)
+
+registry = CollectorRegistry()
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'Tempo de resposta por rota',
+    ('method', 'route'),
+    registry=registry,
+)
+REQUESTS = Counter(
+    'http_requests',
+    'Requisições respondidas por rota e status',
+    ('method', 'route', 'status'),
+    registry=registry,
+)
+# A rota só é conhecida depois do roteamento, então aqui vai só o método
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress',
+    'Requisições em andamento',
+    ('method',),
+    registry=registry,
+    multiprocess_mode='livesum',  # Soma dos workers vivos
+)
+DB_QUERIES = Histogram(
+    'db_queries_per_request',
+    'Consultas ao banco feitas por requisição',
+    ('route',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+    registry=registry,
+)
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds',
+    'Tempo somado das consultas ao banco por requisição',
+    ('route',),
+    registry=registry,
+)
+PASSWORD_HASH_DURATION = Histogram(
+    'password_hash_duration_seconds',
+    'Tempo de CPU do Argon2 por operação',
+    ('operation',),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+    registry=registry,
+)
+
+# Rota usada quando nenhuma casou (404): o caminho cru explodiria o número
+# de séries
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class PoolCollector:
+    """Lê os contadores do pool do engine a cada coleta.
+
+    Recebe a função que devolve o engine, e não o engine: ele só é criado
+    na subida do app.
+    """
+
+    def __init__(self, get_engine):
+        self.get_engine = get_engine
+
+    def collect(self):
+        status = pool_status(self.get_engine().pool)
+        for key in ('size', 'checked_in', 'checked_out', 'overflow'):
+            if key in status:
+                yield GaugeMetricFamily(
+                    f'db_pool_{key}',
+                    f'Conexões do pool ({key})',
+                    value=status[key],
+                )
+
+
+registry.register(PoolCollector(get_engine))
+
+
+def metrics_body() -> tuple[bytes, str]:
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+    # Com vários workers (senpaisearch-serve) cada processo grava as suas
+    # métricas em arquivos, somados aqui. O pool é só o do worker que
+    # respondeu: cada worker tem o seu.
+    combined = CollectorRegistry()
+    multiprocess.MultiProcessCollector(combined)
+    combined.register(PoolCollector(get_engine))
+    return generate_latest(combined), CONTENT_TYPE_LATEST
+
+
+def server_timing(stats: QueryStats, elapsed: float) -> str:
+    return (
+        f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries", '
+        f'app;dur={elapsed * 1000:.1f}'
+    )
+
+
+class MetricsMiddleware:
+    """Mede cada requisição HTTP e conta as consultas feitas por ela.
+
+    É um middleware ASGI puro (não BaseHTTPMiddleware) para não atrapalhar
+    as respostas em streaming. O cabeçalho Server-Timing vai no início da
+    resposta; numa exportação em streaming ele cobre só até esse ponto.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        stats = QueryStats()
+        token = query_stats.set(stats)
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    'Server-Timing',
+                    server_timing(stats, time.perf_counter() - start),
+                )
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.labels(method).inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_PROGRESS.labels(method).dec()
+            query_stats.reset(token)
+
+            # O roteador do FastAPI guarda a rota casada no próprio scope
+            route = scope.get('route')
+            route = route.path if route else UNMATCHED_ROUTE
+            REQUEST_DURATION.labels(method, route).observe(elapsed)
+            REQUESTS.labels(method, route, str(int(status))).inc()
+            DB_QUERIES.labels(route).observe(stats.count)
+            DB_QUERY_DURATION.labels(route).observe(stats.duration)
@@ -1,10 +1,39 @@
 from datetime import datetime
 
-from sqlalchemy import INTEGER, ForeignKey, String, func
-from sqlalchemy.orm import Mapped, mapped_column, registry
+from sqlalchemy import (
+    DDL,
+    INTEGER,
+    Column,
+    Computed,
+    ForeignKey,
+    Index,
+    String,
+    event,
+    func,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import Mapped, deferred, mapped_column, registry
 
 table_registry = registry()
 
+# Configuração de texto usada na busca. A 'simple' não aplica stemming,
+# o que funciona melhor com nomes próprios em japonês romanizado.
+SEARCH_CONFIG = 'simple'
+
+# Pesos de cada coluna no vetor de busca (A é o mais relevante)
+SEARCH_WEIGHTS = {
+    'name': 'A',
+    'anime': 'B',
+    'hierarchy': 'B',
+    'abilities': 'C',
+    'notable_moments': 'D',
+}
+SEARCH_VECTOR_EXPRESSION = ' || '.join(
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({column}, '')), "
+    f"'{weight}')"
+    for column, weight in SEARCH_WEIGHTS.items()
+)
+
 
 @table_registry.mapped_as_dataclass
 class User:
@@ -20,6 +49,10 @@ class User:
     update_at: Mapped[datetime] = mapped_column(
         init=False, server_default=func.now(), onupdate=func.now()
     )
+    # Incrementado para revogar os tokens já emitidos para o usuário
+    token_version: Mapped[int] = mapped_column(
+        init=False, default=0, server_default='0'
+    )
 
 
 @table_registry.mapped_as_dataclass
@@ -35,3 +68,54 @@ class Character:
     notable_moments: Mapped[str]
 
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
+    # Marca criações e alterações; os índices em memória dos workers buscam
+    # por ela o que mudou desde a última atualização
+    updated_at: Mapped[datetime] = mapped_column(
+        init=False, server_default=func.now(), onupdate=func.now()
+    )
+
+    # Coluna gerada pelo banco; fica fora dos campos do dataclass para não
+    # ser carregada (nem serializada) junto com o personagem
+    search_vector = deferred(
+        Column(TSVECTOR, Computed(SEARCH_VECTOR_EXPRESSION, persisted=True))
+    )
+
+    __table_args__ = (
+        # Toda consulta filtra pelo dono; (user_id, id) também atende a
+        # paginação por keyset (WHERE user_id = ? AND id > ? ORDER BY id)
+        Index('ix_characters_user_id_id', 'user_id', 'id'),
+        Index('ix_characters_user_id_anime', 'user_id', 'anime'),
+        Index('ix_characters_user_id_hierarchy', 'user_id', 'hierarchy'),
+        # Ordenação por sort=name e sort=age, também em keyset
+        Index('ix_characters_user_id_name', 'user_id', 'name'),
+        Index('ix_characters_user_id_age_id', 'user_id', 'age', 'id'),
+        Index('ix_characters_updated_at', 'updated_at'),
+        Index(
+            'ix_characters_search_vector',
+            'search_vector',
+            postgresql_using='gin',
+        ),
+        # Índices de trigramas para a busca aproximada (pg_trgm)
+        Index(
+            'ix_characters_name_trgm',
+            'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'},
+        ),
+        Index(
+            'ix_characters_anime_trgm',
+            'anime',
+            postgresql_using='gin',
+            postgresql_ops={'anime': 'gin_trgm_ops'},
+        ),
+    )
+
+
+# Os índices de trigramas dependem da extensão pg_trgm
+event.listen(
+    table_registry.metadata,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(
+        dialect='postgresql'
+    ),
+)
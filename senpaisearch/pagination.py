@@ -0,0 +1,135 @@
+import base64
+import binascii
+import json
+import operator
+from collections.abc import Sequence
+from http import HTTPStatus
+
+from fastapi import HTTPException
+from sqlalchemy import Select, and_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import InstrumentedAttribute
+
+# Maior página que o servidor aceita devolver de uma vez
+MAX_PAGE_SIZE = 100
+
+invalid_cursor_exception = HTTPException(
+    status_code=HTTPStatus.BAD_REQUEST, detail='Invalid cursor'
+)
+
+
+def encode_cursor(*values) -> str:
+    # O cursor é opaco para o cliente: só os valores da chave da última linha
+    payload = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise invalid_cursor_exception
+
+    if not isinstance(values, list):
+        raise invalid_cursor_exception
+
+    return values
+
+
+def _check_cursor(keys: Sequence[InstrumentedAttribute], values: list):
+    if len(values) != len(keys):
+        raise invalid_cursor_exception
+
+    for key, value in zip(keys, values):
+        if value is None and key.expression.nullable:
+            continue
+        if not isinstance(value, key.type.python_type):
+            raise invalid_cursor_exception
+
+
+def _segments(keys: Sequence[InstrumentedAttribute], values: list, descending):
+    """Condições das linhas que vêm depois do cursor, em ordem.
+
+    Só a primeira chave pode ser nula; a segunda (o id) desempata. Na ordem
+    padrão do Postgres os NULLs vêm por último no ASC e primeiro no DESC,
+    que é a mesma ordem de um índice B-tree lido em qualquer sentido.
+    Os NULLs e os valores não nulos ficam em condições separadas: um OR
+    entre eles impediria a leitura de um só trecho do índice, e cada
+    página funda voltaria a varrer e filtrar o outro lado.
+    """
+    compare = operator.lt if descending else operator.gt
+    if len(keys) == 1:
+        return [compare(keys[0], values[0])]
+
+    key, tiebreak = keys
+    value, last = values
+    if value is None:
+        # O cursor parou entre os NULLs: desempata pelo id e, se os NULLs
+        # vêm primeiro, todas as linhas não nulas ainda estão por vir
+        after = and_(key.is_(None), compare(tiebreak, last))
+        return [after, key.is_not(None)] if descending else [after]
+
+    after = compare(tuple_(key, tiebreak), tuple_(value, last))
+    if not descending and key.expression.nullable:
+        return [after, key.is_(None)]
+    return [after]
+
+
+def page_queries(
+    query: Select,
+    keys: Sequence[InstrumentedAttribute],
+    page,
+    descending: bool = False,
+) -> list[Select]:
+    """As consultas de uma página: WHERE keys > cursor ORDER BY keys LIMIT.
+
+    Cada uma busca uma linha a mais que page.limit, que indica se existe
+    próxima página. Quase sempre é uma só; perto da fronteira entre os
+    NULLs e os outros valores de uma chave nula são duas, e a seguinte só
+    precisa rodar se as anteriores não completarem a página.
+    """
+    order = [key.desc() if descending else key for key in keys]
+    conditions = [None]
+    if page.after is not None:
+        values = decode_cursor(page.after)
+        _check_cursor(keys, values)
+        conditions = _segments(keys, values, descending)
+
+    return [
+        (query if condition is None else query.where(condition))
+        .order_by(*order)
+        .limit(page.limit + 1)
+        for condition in conditions
+    ]
+
+
+async def paginate(
+    session: AsyncSession,
+    query: Select,
+    keys: Sequence[InstrumentedAttribute],
+    page,
+    descending: bool = False,
+):
+    """Busca uma página por keyset (WHERE keys > cursor ORDER BY keys).
+
+    Diferente do OFFSET, o custo não cresce com a profundidade da página,
+    já que o banco começa direto do último valor visto pelo índice da chave.
+    keys é a chave de ordenação, opcionalmente seguida do id para desempate;
+    a consulta deve selecionar colunas (não entidades) incluindo todas elas.
+    page traz o cursor (after) e o tamanho (limit) da página.
+    Retorna as linhas como dicts e o cursor da próxima página (None na
+    última).
+    """
+    rows = []
+    for statement in page_queries(query, keys, page, descending):
+        result = await session.execute(statement)
+        rows.extend(dict(row) for row in result.mappings())
+        if len(rows) > page.limit:
+            break
+
+    if len(rows) <= page.limit:
+        return rows, None
+
+    rows = rows[: page.limit]
+    return rows, encode_cursor(*(rows[-1][key.key] for key in keys))
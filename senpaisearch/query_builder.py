@@ -0,0 +1,56 @@
+from sqlalchemy import Select
+
+from senpaisearch.models import Character
+from senpaisearch.schemas import CharacterMatch
+
+# Campos aceitos em sort=; com "-" na frente a ordem é decrescente
+SORT_COLUMNS = {
+    'id': Character.id,
+    'name': Character.name,
+    'age': Character.age,
+}
+
+
+def filter_characters(query: Select, user_id: int, match: CharacterMatch):
+    """Aplica os filtros da listagem (e das facetas) à consulta.
+
+    Igualdade, IN e intervalos vêm primeiro: todos usam os índices B-tree
+    (user_id, anime), (user_id, hierarchy) e (user_id, age, id). Os filtros
+    *_contains viram LIKE '%...%', que nenhum B-tree atende; em anime o
+    índice de trigramas ainda ajuda, em hierarchy é varredura das linhas do
+    usuário.
+    """
+    query = query.where(Character.user_id == user_id)
+
+    if match.anime:
+        query = query.where(Character.anime.in_(match.anime))
+    if match.hierarchy:
+        query = query.where(Character.hierarchy.in_(match.hierarchy))
+    if match.age_min is not None:
+        query = query.where(Character.age >= match.age_min)
+    if match.age_max is not None:
+        query = query.where(Character.age <= match.age_max)
+
+    if match.anime_contains:
+        query = query.where(Character.anime.contains(match.anime_contains))
+    if match.hierarchy_contains:
+        query = query.where(
+            Character.hierarchy.contains(match.hierarchy_contains)
+        )
+
+    return query
+
+
+def sort_keys(sort: str):
+    """Chaves do keyset para sort= e se a ordem é decrescente.
+
+    Colunas que podem repetir valores (age) vêm seguidas do id, que
+    desempata as linhas e fixa a posição exata do cursor; id e name são
+    únicos e dispensam o desempate.
+    """
+    descending = sort.startswith('-')
+    column = SORT_COLUMNS[sort.removeprefix('-')]
+    if column.expression.primary_key or column.expression.unique:
+        return (column,), descending
+
+    return (column, Character.id), descending
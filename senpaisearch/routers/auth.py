@@ -3,43 +3,59 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from senpaisearch.database import get_session
 from senpaisearch.models import User
 from senpaisearch.schemas import Token
 from senpaisearch.security import (
+    Principal,
     create_access_token,
     get_current_user,
-    verify_password,
+    remember_user,
+    token_data,
+    verify_and_update_password,
 )
 
 router = APIRouter(prefix='/auth', tags=['auth'])
-T_Session = Annotated[Session, Depends(get_session)]
+T_Session = Annotated[AsyncSession, Depends(get_session)]
 T_OAuth2Form = Annotated[OAuth2PasswordRequestForm, Depends()]
 
 
 @router.post('/token', response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
     session: T_Session,
     form_data: T_OAuth2Form,
 ):
-    user = session.scalar(
+    user = await session.scalar(
         select(User).where((User.email == form_data.username))
     )
-    if not user or not verify_password(form_data.password, user.password):
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await verify_and_update_password(
+            form_data.password, user.password
+        )
+    if not valid:
         raise HTTPException(
             status_code=400, detail='Incorrect email or password'
         )
-    access_token = create_access_token(data={'sub': user.email})
+
+    # Os parâmetros do Argon2 mudaram desde o último login: regrava o hash
+    if new_hash:
+        user.password = new_hash
+        await session.commit()
+
+    # Já deixa o usuário no cache para as próximas requisições autenticadas
+    remember_user(user)
+    access_token = create_access_token(data=token_data(user))
 
     return {'access_token': access_token, 'token_type': 'Bearer'}
 
 
 @router.post('/refresh_token', response_model=Token)
-def refresh_access_token(
-    user: User = Depends(get_current_user),
+async def refresh_access_token(
+    user: Principal = Depends(get_current_user),
 ):
-    new_access_token = create_access_token(data={'sub': user.email})
+    new_access_token = create_access_token(data=token_data(user))
 
     return {'access_token': new_access_token, 'token_type': 'bearer'}
@@ -1,110 +1,702 @@
+import csv
+import io
+from collections import defaultdict
+from dataclasses import asdict
 from http import HTTPStatus
-from typing import Annotated
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import (
+    Boolean,
+    Integer,
+    String,
+    any_,
+    bindparam,
+    case,
+    cast,
+    delete,
+    func,
+    insert,
+    literal,
+    null,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from senpaisearch.database import get_session
-from senpaisearch.models import Character, User
+from senpaisearch.autocomplete import get_autocomplete_index
+from senpaisearch.bulk_import import (
+    import_characters,
+    iter_csv_records,
+    iter_lines,
+    iter_ndjson_records,
+)
+from senpaisearch.cache import get_response_cache, json_response
+from senpaisearch.database import (
+    get_read_session,
+    get_session,
+    read_connection,
+)
+from senpaisearch.models import SEARCH_CONFIG, Character
+from senpaisearch.pagination import paginate
+from senpaisearch.query_builder import filter_characters, sort_keys
 from senpaisearch.schemas import (
+    Autocomplete,
+    AutocompleteQuery,
+    CharacterBatchDelete,
+    CharacterBatchReport,
+    CharacterBatchUpdate,
     CharacterCreate,
+    CharacterFacets,
+    CharacterFilter,
     CharacterList,
+    CharacterMatch,
     CharacterPublic,
+    CharacterSearch,
+    CharacterSearchList,
+    CharacterSummary,
     CharacterUpdate,
+    ImportReport,
     Message,
+    SimilarCharacterList,
+    SimilarQuery,
 )
-from senpaisearch.security import get_current_user
+from senpaisearch.security import Principal, get_current_user
 
 router = APIRouter(prefix='/characters', tags=['characters'])
 
-Session = Annotated[Session, Depends(get_session)]
-CurrentUser = Annotated[User, Depends(get_current_user)]
+
+def _similarity():
+    """O módulo do índice de parecidos, que importa numpy e scipy.
+
+    Fica fora da importação do app (são ~200 ms): o lifespan o importa na
+    subida de cada worker, e aqui ele já está carregado.
+    """
+    from senpaisearch import similarity  # noqa: PLC0415
+
+    return similarity
+
+
+Session = Annotated[AsyncSession, Depends(get_session)]
+# Rotas só de leitura podem usar uma réplica (veja database.RoutingSession)
+ReadSession = Annotated[AsyncSession, Depends(get_read_session)]
+CurrentUser = Annotated[Principal, Depends(get_current_user)]
+
+# Formatos aceitos pela importação em lote, pelo Content-Type
+IMPORT_FORMATS = {
+    'application/x-ndjson': iter_ndjson_records,
+    'application/jsonl': iter_ndjson_records,
+    'text/csv': iter_csv_records,
+}
+
+# Facetas na ordem dos conjuntos do GROUPING SETS e largura das faixas de
+# idade (0-9, 10-19, ...)
+FACETS = ('anime', 'hierarchy', 'age')
+AGE_BUCKET_SIZE = 10
+# Linhas buscadas do cursor do servidor (e enviadas) por vez na exportação
+EXPORT_BATCH_SIZE = 1000
+# Colunas de CharacterPublic, usadas nas consultas que não precisam da
+# entidade inteira (listagem e exportação)
+PUBLIC_COLUMNS = (
+    Character.id,
+    Character.name,
+    Character.age,
+    Character.anime,
+    Character.hierarchy,
+    Character.abilities,
+    Character.notable_moments,
+)
+
+
+def _projection(fields: list[str] | None, keys):
+    """Colunas selecionadas para os campos pedidos em fields=."""
+    if not fields:
+        return PUBLIC_COLUMNS
+
+    names = set(fields)
+    if 'summary' in names:
+        names.update(CharacterSummary.model_fields)
+    # As chaves do cursor (id e o campo de sort=) sempre vão junto
+    names.update(key.key for key in keys)
+    return tuple(column for column in PUBLIC_COLUMNS if column.key in names)
+
+
+# Restrições únicas de characters e o erro que cada violação vira
+UNIQUE_VIOLATIONS = {'characters_name_key': 'Character name already exists'}
+
+
+def _cache_namespace(user_id: int):
+    # Listagens em cache de um usuário; invalidadas a cada escrita dele
+    return f'characters:{user_id}'
 
 
 @router.post('/', response_model=CharacterPublic)
-def create_character(
+async def create_character(
     character: CharacterCreate,
     session: Session,
     user: CurrentUser,
 ):
-    # Extraindo os campos enviados
-    db_character = Character(
-        name=character.name,
-        age=character.age,
-        anime=character.anime,
-        hierarchy=character.hierarchy,
-        abilities=character.abilities,
-        notable_moments=character.notable_moments,
-        user_id=user.id,
-    )
-    session.add(db_character)
-    session.commit()
-    session.refresh(db_character)
+    # Um único INSERT ... RETURNING, sem refresh depois do commit
+    try:
+        result = await session.execute(
+            insert(Character)
+            .values(**character.model_dump(), user_id=user.id)
+            .returning(*PUBLIC_COLUMNS)
+        )
+        db_character = result.mappings().one()
+        await session.commit()
+    except IntegrityError as error:
+        await session.rollback()
+        detail = UNIQUE_VIOLATIONS.get(error.orig.diag.constraint_name)
+        if not detail:
+            raise
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=detail)
+    await get_response_cache().invalidate(_cache_namespace(user.id))
+    get_autocomplete_index().save(
+        user.id,
+        db_character['id'],
+        db_character['name'],
+        db_character['anime'],
+    )
+    _similarity().similarity_index.save(
+        user.id,
+        db_character['id'],
+        _similarity().document(
+            db_character['abilities'], db_character['notable_moments']
+        ),
+    )
+
     return db_character
 
 
+@router.post('/import', response_model=ImportReport)
+async def import_characters_in_bulk(
+    request: Request,
+    session: Session,
+    user: CurrentUser,
+):
+    content_type = request.headers.get('content-type', '')
+    parse_records = IMPORT_FORMATS.get(content_type.split(';')[0].strip())
+    if not parse_records:
+        raise HTTPException(
+            status_code=HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+            detail='Send text/csv or application/x-ndjson',
+        )
+
+    # O corpo é lido em streaming, sem carregar o arquivo todo na memória
+    records = parse_records(iter_lines(request.stream()))
+    report = await import_characters(session, user.id, records)
+    if report['imported']:
+        await get_response_cache().invalidate(_cache_namespace(user.id))
+        get_autocomplete_index().forget(user.id)
+        # A importação não devolve as linhas; o índice busca os ids novos
+        await _similarity().similarity_index.catch_up(session)
+
+    return report
+
+
 @router.get('/', response_model=CharacterList)
-def list_characters(
+async def list_characters(
+    request: Request,
+    session: ReadSession,
+    user: CurrentUser,
+    character_filter: Annotated[CharacterFilter, Query()],
+):
+    cache_key = await get_response_cache().key(
+        _cache_namespace(user.id), character_filter.model_dump_json()
+    )
+    body = await get_response_cache().get(cache_key)
+    if body is None:
+        body = await _list_characters_body(session, user, character_filter)
+        await get_response_cache().set(cache_key, body)
+
+    return json_response(request, body)
+
+
+async def _list_characters_body(
+    session: AsyncSession, user: Principal, character_filter: CharacterFilter
+) -> bytes:
+    # Só as colunas pedidas saem do banco: abilities e notable_moments são
+    # os campos mais pesados e raramente aparecem nas telas de listagem
+    keys, descending = sort_keys(character_filter.sort)
+    query = filter_characters(
+        select(*_projection(character_filter.fields, keys)),
+        user.id,
+        character_filter,
+    )
+
+    characters, next_cursor = await paginate(
+        session, query, keys, character_filter, descending
+    )
+
+    # As linhas já estão no formato de CharacterList; serializar direto com
+    # orjson evita validar de novo dados que acabaram de sair do banco
+    return orjson.dumps({'characters': characters, 'next_cursor': next_cursor})
+
+
+@router.get('/facets', response_model=CharacterFacets)
+async def character_facets(
+    request: Request,
+    session: ReadSession,
+    user: CurrentUser,
+    match: Annotated[CharacterMatch, Query()],
+):
+    # Mesmo namespace da listagem: as escritas invalidam as duas
+    cache_key = await get_response_cache().key(
+        _cache_namespace(user.id), f'facets:{match.model_dump_json()}'
+    )
+    body = await get_response_cache().get(cache_key)
+    if body is None:
+        body = await _character_facets_body(session, user, match)
+        await get_response_cache().set(cache_key, body)
+
+    return json_response(request, body)
+
+
+def _age_range(age: int | None) -> str | None:
+    return None if age is None else f'{age}-{age + AGE_BUCKET_SIZE - 1}'
+
+
+async def _character_facets_body(
+    session: AsyncSession, user: Principal, match: CharacterMatch
+) -> bytes:
+    filtered = filter_characters(
+        select(
+            Character.anime,
+            Character.hierarchy,
+            (Character.age // AGE_BUCKET_SIZE * AGE_BUCKET_SIZE).label('age'),
+        ),
+        user.id,
+        match,
+    ).subquery()
+
+    # Um único GROUP BY GROUPING SETS conta as três facetas de uma vez.
+    # grouping(anime, hierarchy) diz a qual conjunto a linha pertence: 1
+    # quando agrupada por anime, 2 por hierarchy e 3 por faixa de idade.
+    grouping = func.grouping(filtered.c.anime, filtered.c.hierarchy)
+    count = func.count()
+    query = (
+        select(
+            grouping,
+            filtered.c.anime,
+            filtered.c.hierarchy,
+            filtered.c.age,
+            count,
+        )
+        .group_by(
+            func.grouping_sets(
+                filtered.c.anime, filtered.c.hierarchy, filtered.c.age
+            )
+        )
+        .order_by(
+            count.desc(),
+            filtered.c.anime,
+            filtered.c.hierarchy,
+            filtered.c.age,
+        )
+    )
+
+    facets = {name: [] for name in FACETS}
+    for group, anime, hierarchy, age, total in await session.execute(query):
+        value = (anime, hierarchy, _age_range(age))[group - 1]
+        facets[FACETS[group - 1]].append({'value': value, 'count': total})
+
+    return orjson.dumps(facets)
+
+
+@router.get('/autocomplete', response_model=Autocomplete)
+async def autocomplete(
+    session: ReadSession,
+    user: CurrentUser,
+    query: Annotated[AutocompleteQuery, Query()],
+):
+    # Só o primeiro pedido de cada usuário (por worker e por TTL) vai ao
+    # banco; os seguintes são respondidos pelo índice em memória
+    suggestions = await get_autocomplete_index().get(session, user.id)
+
+    return {
+        'names': suggestions.names.search(query.q, query.limit),
+        'anime': suggestions.anime.search(query.q, query.limit),
+    }
+
+
+@router.get('/{character_id}/similar', response_model=SimilarCharacterList)
+async def similar_characters(
+    character_id: int,
     session: Session,
     user: CurrentUser,
-    anime: str | None = None,
-    hierarchy: str | None = None,
-    limit: int | None = None,
+    query: Annotated[SimilarQuery, Query()],
+):
+    # Os vizinhos saem do índice em memória; o banco só completa os dados
+    # dos k escolhidos
+    await _similarity().similarity_index.ensure_loaded(session)
+    matches = await _similarity().similarity_index.similar(
+        [character_id], user.id, query.limit
+    )
+    if character_id not in matches:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND, detail='Character not found'
+        )
+
+    scores = dict(matches[character_id])
+    if not scores:
+        return {'characters': []}
+
+    result = await session.execute(
+        select(*PUBLIC_COLUMNS).where(*_owned_ids(user.id, list(scores)))
+    )
+    characters = {row['id']: row for row in result.mappings()}
+
+    # Um personagem apagado por outro worker ainda pode estar no índice:
+    # fica fora da resposta e sai do índice deste worker
+    for id_ in scores.keys() - characters.keys():
+        _similarity().similarity_index.remove(user.id, id_)
+
+    return {
+        'characters': [
+            {**characters[id_], 'score': score}
+            for id_, score in scores.items()
+            if id_ in characters
+        ]
+    }
+
+
+@router.get('/export')
+async def export_characters(
+    session: ReadSession,
+    user: CurrentUser,
+    export_format: Annotated[
+        Literal['ndjson', 'csv'], Query(alias='format')
+    ] = 'ndjson',
+):
+    query = (
+        select(*PUBLIC_COLUMNS)
+        .where(Character.user_id == user.id)
+        .order_by(Character.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    media_type = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+    return StreamingResponse(
+        _stream_export(session, query, export_format),
+        media_type=media_type[export_format],
+        headers={
+            'Content-Disposition': (
+                f'attachment; filename="characters.{export_format}"'
+            )
+        },
+    )
+
+
+async def _stream_export(session: AsyncSession, query, export_format: str):
+    # A sessão da requisição é fechada antes do corpo ser enviado, então a
+    # exportação usa uma conexão própria, no banco (réplica ou primário)
+    # que a sessão escolheria. conn.stream abre um cursor no servidor: cada
+    # lote é lido e enviado sem materializar a lista inteira.
+    async with read_connection(session, query) as conn:
+        result = await conn.stream(query)
+        if export_format == 'csv':
+            yield _csv_lines([column.key for column in PUBLIC_COLUMNS])
+        async for rows in result.partitions():
+            if export_format == 'csv':
+                yield _csv_lines(*rows)
+            else:
+                yield b''.join(
+                    orjson.dumps(row._asdict()) + b'\n' for row in rows
+                )
+
+
+def _csv_lines(*rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue()
+
+
+@router.get('/search', response_model=CharacterSearchList)
+async def search_characters(
+    session: ReadSession,
+    user: CurrentUser,
+    search: Annotated[CharacterSearch, Query()],
 ):
-    query = select(Character).where(Character.user_id == user.id)
+    if search.fuzzy:
+        # O operador <% usa o limiar da sessão; set_config com is_local=True
+        # vale só para a transação atual
+        await session.execute(
+            select(
+                func.set_config(
+                    'pg_trgm.word_similarity_threshold',
+                    str(search.threshold),
+                    True,
+                )
+            )
+        )
+        query = _fuzzy_search_query(search.q)
+    else:
+        query = _full_text_search_query(search.q)
 
-    if anime:
-        query = query.filter(Character.anime.contains(anime))
-    if hierarchy:
-        query = query.filter(Character.hierarchy.contains(hierarchy))
+    query = query.where(Character.user_id == user.id).limit(search.limit)
 
-    characters = session.scalars(query.limit(limit)).all()
+    characters = [
+        {**asdict(character), 'rank': score, 'headline': snippet}
+        for character, score, snippet in await session.execute(query)
+    ]
 
     return {'characters': characters}
 
 
+def _full_text_search_query(q: str):
+    # websearch_to_tsquery aceita a sintaxe de buscadores ("aspas", -termo, or)
+    ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+    rank = func.ts_rank_cd(Character.search_vector, ts_query)
+    headline = func.ts_headline(
+        SEARCH_CONFIG,
+        func.concat_ws(' ', Character.abilities, Character.notable_moments),
+        ts_query,
+        'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20',
+    )
+
+    return (
+        select(Character, rank.label('rank'), headline.label('headline'))
+        .where(Character.search_vector.bool_op('@@')(ts_query))
+        .order_by(rank.desc(), Character.id)
+    )
+
+
+def _fuzzy_search_query(q: str):
+    # word_similarity compara o termo com o trecho mais parecido do texto,
+    # então "Naurto" encontra "Naruto Shippuden". O filtro com <% é o que
+    # permite usar os índices gin_trgm_ops de name e anime.
+    term = literal(q, String)
+    score = func.greatest(
+        func.word_similarity(term, Character.name),
+        func.word_similarity(term, Character.anime),
+    )
+
+    return (
+        select(Character, score.label('rank'), null().label('headline'))
+        .where(
+            or_(
+                term.bool_op('<%')(Character.name),
+                term.bool_op('<%')(Character.anime),
+            )
+        )
+        .order_by(score.desc(), Character.id)
+    )
+
+
+def _owned_ids(user_id: int, ids: list[int]):
+    # id = ANY(:ids) com um único parâmetro array: o texto do comando é o
+    # mesmo para qualquer quantidade de ids
+    return (
+        Character.user_id == user_id,
+        Character.id == any_(bindparam('ids', ids, type_=ARRAY(Integer))),
+    )
+
+
+def _batch_update(user_id: int, patches: dict[int, dict]):
+    """Um único UPDATE ... FROM unnest(...) para o lote inteiro.
+
+    Cada coluna alterada por algum patch vai como dois arrays paralelos
+    aos ids: o valor novo e se o patch a altera. Quem não a altera mantém
+    o valor atual, então patches com mudanças diferentes cabem no mesmo
+    comando.
+    """
+    columns = [
+        column
+        for column in CharacterUpdate.model_fields
+        if any(column in changes for changes in patches.values())
+    ]
+    arrays = {'id': cast(bindparam('ids', list(patches)), ARRAY(Integer))}
+    for column in columns:
+        arrays[column] = cast(
+            bindparam(
+                column, [changes.get(column) for changes in patches.values()]
+            ),
+            ARRAY(String),
+        )
+        arrays[f'set_{column}'] = cast(
+            bindparam(
+                f'set_{column}',
+                [column in changes for changes in patches.values()],
+            ),
+            ARRAY(Boolean),
+        )
+    rows = (
+        func
+        .unnest(*arrays.values())
+        .table_valued(*arrays)
+        .render_derived(name='patches')
+    )
+
+    values = {}
+    for column in columns:
+        # age chega como texto, igual ao PATCH de um personagem só
+        new = rows.c[column]
+        if column == 'age':
+            new = cast(new, Integer)
+        values[column] = case(
+            (rows.c[f'set_{column}'], new),
+            else_=getattr(Character, column),
+        )
+
+    return (
+        update(Character)
+        .where(Character.user_id == user_id, Character.id == rows.c.id)
+        .values(values)
+        .returning(
+            Character.id, Character.abilities, Character.notable_moments
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _batch_report(ids: list[int], done: set[int], status: str):
+    return {
+        'results': [
+            {'id': id_, 'status': status if id_ in done else 'not_found'}
+            for id_ in dict.fromkeys(ids)
+        ]
+    }
+
+
+@router.patch('/batch', response_model=CharacterBatchReport)
+async def patch_characters_in_batch(
+    batch: CharacterBatchUpdate,
+    session: Session,
+    user: CurrentUser,
+):
+    # Um id repetido no lote acumula as mudanças; o último patch vence
+    patches = defaultdict(dict)
+    for patch in batch.characters:
+        patches[patch.id].update(
+            patch.model_dump(exclude_unset=True, exclude={'id'})
+        )
+
+    try:
+        result = await session.execute(_batch_update(user.id, patches))
+        updated = {
+            id_: _similarity().document(abilities, moments)
+            for id_, abilities, moments in result
+        }
+        await session.commit()
+    except IntegrityError as error:
+        # Tudo ou nada: um nome repetido desfaz o lote inteiro
+        await session.rollback()
+        detail = UNIQUE_VIOLATIONS.get(error.orig.diag.constraint_name)
+        if not detail:
+            raise
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=detail)
+
+    if updated:
+        await get_response_cache().invalidate(_cache_namespace(user.id))
+        get_autocomplete_index().forget(user.id)
+    for id_, text in updated.items():
+        _similarity().similarity_index.save(user.id, id_, text)
+
+    ids = [patch.id for patch in batch.characters]
+    return _batch_report(ids, set(updated), 'updated')
+
+
+@router.post('/batch/delete', response_model=CharacterBatchReport)
+async def delete_characters_in_batch(
+    batch: CharacterBatchDelete,
+    session: Session,
+    user: CurrentUser,
+):
+    deleted = set(
+        await session.scalars(
+            delete(Character)
+            .where(*_owned_ids(user.id, batch.ids))
+            .returning(Character.id)
+            .execution_options(synchronize_session=False)
+        )
+    )
+    await session.commit()
+
+    if deleted:
+        await get_response_cache().invalidate(_cache_namespace(user.id))
+        get_autocomplete_index().forget(user.id)
+    for id_ in deleted:
+        _similarity().similarity_index.remove(user.id, id_)
+
+    return _batch_report(batch.ids, deleted, 'deleted')
+
+
 @router.delete('/{character_id}', response_model=Message)
-def delete_character(
+async def delete_character(
     character_id: int,
     session: Session,
     user: CurrentUser,
 ):
-    character = session.scalar(
-        select(Character).where(
-            Character.user_id == user.id, Character.id == character_id
-        )
+    deleted = await session.scalar(
+        delete(Character)
+        .where(Character.user_id == user.id, Character.id == character_id)
+        .returning(Character.id)
+        .execution_options(synchronize_session=False)
     )
-    if not character:
+    if not deleted:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
             detail='Character not found',
         )
-    session.delete(character)
-    session.commit()
+    await session.commit()
+    await get_response_cache().invalidate(_cache_namespace(user.id))
+    get_autocomplete_index().remove(user.id, character_id)
+    _similarity().similarity_index.remove(user.id, character_id)
 
     return {'message': 'Character has been deleted successfully.'}
 
 
 @router.patch('/{character_id}', response_model=CharacterPublic)
-def patch_character(
+async def patch_character(
     character_id: int,
     session: Session,
     user: CurrentUser,
     character: CharacterUpdate,
 ):
-    db_character = session.scalar(
-        select(Character).where(Character.user_id == user.id)
-    )
+    owned = (Character.user_id == user.id, Character.id == character_id)
+    changes = character.model_dump(exclude_unset=True)
+    if changes:
+        statement = (
+            update(Character)
+            .where(*owned)
+            .values(changes)
+            .returning(*PUBLIC_COLUMNS)
+            .execution_options(synchronize_session=False)
+        )
+    else:
+        statement = select(*PUBLIC_COLUMNS).where(*owned)
+
+    try:
+        result = await session.execute(statement)
+        db_character = result.mappings().one_or_none()
+        await session.commit()
+    except IntegrityError as error:
+        await session.rollback()
+        detail = UNIQUE_VIOLATIONS.get(error.orig.diag.constraint_name)
+        if not detail:
+            raise
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=detail)
     if not db_character:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail='Character not found.'
         )
-    for key, value in character.model_dump(exclude_unset=True).items():
-        setattr(db_character, key, value)
-
-    session.add(db_character)
-    session.commit()
-    session.refresh(db_character)
+    if changes:
+        await get_response_cache().invalidate(_cache_namespace(user.id))
+        get_autocomplete_index().save(
+            user.id, character_id, db_character['name'], db_character['anime']
+        )
+        _similarity().similarity_index.save(
+            user.id,
+            character_id,
+            _similarity().document(
+                db_character['abilities'], db_character['notable_moments']
+            ),
+        )
 
     return db_character
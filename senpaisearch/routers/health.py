@@ -0,0 +1,36 @@
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from senpaisearch.database import (
+    get_engine,
+    get_replicas,
+    get_session,
+    pool_status,
+)
+from senpaisearch.schemas import DatabaseHealth
+
+router = APIRouter(prefix='/health', tags=['health'])
+T_Session = Annotated[AsyncSession, Depends(get_session)]
+
+
+@router.get('/db', response_model=DatabaseHealth)
+async def database_health(session: T_Session):
+    try:
+        await session.execute(select(1))
+    except SQLAlchemyError:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail='Database unavailable',
+        )
+
+    # Réplicas fora do ar não derrubam o status: as leituras caem no primário
+    return {
+        'status': 'ok',
+        'pool': pool_status(get_engine().pool),
+        'replicas': await get_replicas().check(),
+    }
@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Response
+
+from senpaisearch.metrics import metrics_body
+
+router = APIRouter(tags=['metrics'])
+
+
+# Formato de exposição do Prometheus; fica fora da documentação da API
+@router.get('/metrics', include_in_schema=False)
+async def read_metrics():
+    body, media_type = metrics_body()
+
+    return Response(body, media_type=media_type)
@@ -1,72 +1,97 @@
 from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from senpaisearch.database import get_session
+from senpaisearch.database import get_read_session, get_session
 from senpaisearch.models import User
+from senpaisearch.pagination import paginate
 from senpaisearch.schemas import (
+    FilterPage,
     Message,
     UserList,
     UserPublic,
     UserSchema,
 )
-from senpaisearch.security import get_current_user, get_password_hash
+from senpaisearch.security import (
+    Principal,
+    forget_user,
+    get_current_user,
+    get_password_hash,
+)
 
 router = APIRouter(prefix='/users', tags=['users'])
-T_Session = Annotated[Session, Depends(get_session)]
-T_CurrentUser = Annotated[User, Depends(get_current_user)]
+T_Session = Annotated[AsyncSession, Depends(get_session)]
+T_ReadSession = Annotated[AsyncSession, Depends(get_read_session)]
+T_CurrentUser = Annotated[Principal, Depends(get_current_user)]
+
+# Colunas de UserPublic: a listagem não carrega senha nem datas
+USER_PUBLIC_COLUMNS = (User.id, User.username, User.email)
+
+# Restrições únicas de users e o erro que cada violação vira
+UNIQUE_VIOLATIONS = {
+    'users_username_key': 'Username already exists',
+    'users_email_key': 'Email already exists',
+}
+
+
+async def _write_user(session: AsyncSession, statement):
+    """Executa o INSERT/UPDATE ... RETURNING e confirma a transação.
+
+    Duplicidades são detectadas pelas próprias restrições únicas, sem uma
+    consulta antes da escrita.
+    """
+    try:
+        result = await session.execute(statement)
+        row = result.mappings().one_or_none()
+        await session.commit()
+    except IntegrityError as error:
+        await session.rollback()
+        detail = UNIQUE_VIOLATIONS.get(error.orig.diag.constraint_name)
+        if not detail:
+            raise
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=detail)
+
+    return row
 
 
 @router.get('/', response_model=UserList)
-def read_users(
-    session: T_Session,
-    limit: int = 100,
-    offset: int = 0,
+async def read_users(
+    session: T_ReadSession,
+    page: Annotated[FilterPage, Query()],
 ):
-    users = session.scalars(select(User).offset(offset).limit(limit)).all()
+    users, next_cursor = await paginate(
+        session, select(*USER_PUBLIC_COLUMNS), (User.id,), page
+    )
 
-    return {'users': users}
+    # Linhas vindas do nosso banco já têm o formato de UserList: a resposta
+    # é serializada direto, sem validar tudo de novo pelo response_model
+    return ORJSONResponse({'users': users, 'next_cursor': next_cursor})
 
 
 @router.post('/', status_code=HTTPStatus.CREATED, response_model=UserPublic)
-def create_user(
+async def create_user(
     user: UserSchema,
     session: T_Session,
 ):
-    db_user = session.scalar(
-        select(User).where(
-            (User.username == user.username) | (User.email == user.email)
+    return await _write_user(
+        session,
+        insert(User)
+        .values(
+            username=user.username,
+            email=user.email,
+            password=await get_password_hash(user.password),
         )
+        .returning(*USER_PUBLIC_COLUMNS),
     )
-    if db_user:
-        if db_user.username == user.username:
-            raise HTTPException(
-                status_code=HTTPStatus.BAD_REQUEST,
-                detail='Username already exists',
-            )
-        elif db_user.email == user.email:
-            raise HTTPException(
-                status_code=HTTPStatus.BAD_REQUEST,
-                detail='Email already exists',
-            )
-
-    db_user = User(
-        username=user.username,
-        email=user.email,
-        password=get_password_hash(user.password),
-    )
-    session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
-
-    return db_user
 
 
 @router.put('/{user_id}', response_model=UserPublic)
-def update_user(
+async def update_user(
     user_id: int,
     user: UserSchema,
     session: T_Session,
@@ -77,19 +102,31 @@ def update_user(
             status_code=HTTPStatus.FORBIDDEN, detail='Not enough permissions'
         )
 
-    current_user.email = user.email
-    current_user.username = user.username
-    current_user.password = user.password
-
-    session.add(current_user)
-    session.commit()
-    session.refresh(current_user)
+    db_user = await _write_user(
+        session,
+        update(User)
+        .where(User.id == current_user.id)
+        .values(
+            email=user.email,
+            username=user.username,
+            password=await get_password_hash(user.password),
+            # As credenciais mudaram: os tokens emitidos até aqui deixam de
+            # valer
+            token_version=User.token_version + 1,
+        )
+        .returning(*USER_PUBLIC_COLUMNS),
+    )
+    if not db_user:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND, detail='User not found'
+        )
+    forget_user(current_user.id)
 
-    return current_user
+    return db_user
 
 
 @router.delete('/{user_id}', response_model=Message)
-def delete_user(
+async def delete_user(
     user_id: int,
     session: T_Session,
     current_user: T_CurrentUser,
@@ -99,7 +136,8 @@ def delete_user(
             status_code=HTTPStatus.FORBIDDEN, detail='Not enough permissions'
         )
 
-    session.delete(current_user)
-    session.commit()
+    await session.execute(delete(User).where(User.id == current_user.id))
+    await session.commit()
+    forget_user(current_user.id)
 
     return {'message': 'User deleted'}
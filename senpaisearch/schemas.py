@@ -1,12 +1,42 @@
-from typing import Optional
+from typing import Annotated, Literal, Optional
 
-from pydantic import BaseModel, ConfigDict, EmailStr
+from pydantic import (
+    BaseModel,
+    BeforeValidator,
+    ConfigDict,
+    EmailStr,
+    Field,
+    field_validator,
+    model_validator,
+)
+
+from senpaisearch.pagination import MAX_PAGE_SIZE
 
 
 class Message(BaseModel):
     message: str
 
 
+class PoolStatus(BaseModel):
+    pool_class: str
+    size: int | None = None
+    checked_in: int | None = None
+    checked_out: int | None = None
+    overflow: int | None = None
+
+
+class ReplicaHealth(BaseModel):
+    host: str | None
+    status: str
+    pool: PoolStatus
+
+
+class DatabaseHealth(BaseModel):
+    status: str
+    pool: PoolStatus
+    replicas: list[ReplicaHealth] = []
+
+
 class UserSchema(BaseModel):
     username: str
     email: EmailStr
@@ -22,6 +52,12 @@ class UserPublic(BaseModel):
 
 class UserList(BaseModel):
     users: list[UserPublic]
+    next_cursor: str | None = None  # Cursor da próxima página, se houver
+
+
+class FilterPage(BaseModel):
+    after: str | None = None  # Cursor devolvido pela página anterior
+    limit: int = Field(default=MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
 
 
 class Token(BaseModel):
@@ -49,8 +85,144 @@ class CharacterPublic(CharacterBase):
     id: int
 
 
+# Versão compacta para telas de listagem, sem os campos de texto longo
+class CharacterSummary(BaseModel):
+    id: int
+    name: str
+    anime: str
+
+
+# Personagem da listagem com fields=: vêm os campos pedidos mais as chaves
+# do cursor (o campo de sort= e, se ele repete valores, o id), então
+# qualquer campo pode faltar
+class CharacterProjection(BaseModel):
+    id: Optional[int] = None
+    name: Optional[str] = None
+    age: Optional[int] = None
+    anime: Optional[str] = None
+    hierarchy: Optional[str] = None
+    abilities: Optional[str] = None
+    notable_moments: Optional[str] = None
+
+
 class CharacterList(BaseModel):
-    characters: list[CharacterPublic]
+    # Sem fields=, cada personagem vem completo (CharacterPublic)
+    characters: list[CharacterPublic | CharacterProjection]
+    next_cursor: str | None = None
+
+
+# Campos que podem ser pedidos em fields=; summary equivale aos campos de
+# CharacterSummary
+CharacterField = Literal[
+    'id',
+    'name',
+    'age',
+    'anime',
+    'hierarchy',
+    'abilities',
+    'notable_moments',
+    'summary',
+]
+
+
+def _split_fields(value):
+    # Aceita tanto fields=name,anime quanto fields=name&fields=anime
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = [value]
+    return [
+        field.strip()
+        for item in value
+        for field in item.split(',')
+        if field.strip()
+    ]
+
+
+# Filtros comuns à listagem e às facetas. anime e hierarchy comparam o
+# valor exato e podem ser repetidos (anime=Naruto&anime=Bleach); os
+# *_contains procuram um trecho do texto
+class CharacterMatch(BaseModel):
+    anime: list[str] | None = None
+    hierarchy: list[str] | None = None
+    anime_contains: str | None = None
+    hierarchy_contains: str | None = None
+    age_min: int | None = Field(default=None, ge=0)
+    age_max: int | None = Field(default=None, ge=0)
+
+
+CharacterSort = Literal['id', '-id', 'name', '-name', 'age', '-age']
+
+
+class CharacterFilter(FilterPage, CharacterMatch):
+    sort: CharacterSort = 'id'
+    fields: Annotated[
+        list[CharacterField] | None, BeforeValidator(_split_fields)
+    ] = None
+
+
+class FacetCount(BaseModel):
+    value: str | None  # Nas idades, a faixa ("20-29"); None é sem idade
+    count: int
+
+
+class CharacterFacets(BaseModel):
+    # Cada lista vem da maior contagem para a menor
+    anime: list[FacetCount]
+    hierarchy: list[FacetCount]
+    age: list[FacetCount]
+
+
+# Parâmetros de busca: fuzzy=true troca a busca textual pela aproximada
+# (pg_trgm), que tolera erros de digitação em name e anime
+class CharacterSearch(BaseModel):
+    q: str = Field(min_length=1)
+    fuzzy: bool = False
+    threshold: float = Field(default=0.4, gt=0, le=1)
+    limit: int = Field(default=20, ge=1, le=100)
+
+
+class CharacterSearchResult(CharacterPublic):
+    rank: float  # Relevância do resultado para a busca
+    # Trecho com os termos encontrados destacados (só na busca textual)
+    headline: str | None = None
+
+
+class CharacterSearchList(BaseModel):
+    characters: list[CharacterSearchResult]
+
+
+class SimilarQuery(BaseModel):
+    limit: int = Field(default=10, ge=1, le=50)
+
+
+class SimilarCharacter(CharacterPublic):
+    score: float  # Cosseno entre os textos (1 = mesmos termos)
+
+
+class SimilarCharacterList(BaseModel):
+    characters: list[SimilarCharacter]
+
+
+class AutocompleteQuery(BaseModel):
+    q: str = Field(min_length=1)
+    limit: int = Field(default=10, ge=1, le=50)
+
+
+class Autocomplete(BaseModel):
+    names: list[str]
+    anime: list[str]
+
+
+class ImportRowError(BaseModel):
+    line: int  # Linha do arquivo enviado (no CSV, onde o registro começa)
+    detail: str
+
+
+class ImportReport(BaseModel):
+    imported: int
+    failed: int
+    errors: list[ImportRowError]  # Limitada aos primeiros erros
 
 
 class CharacterUpdate(BaseModel):
@@ -60,3 +232,47 @@ class CharacterUpdate(BaseModel):
     hierarchy: str | None = None
     abilities: str | None = None
     notable_moments: str | None = None
+
+    # Podem ser omitidos, mas null violaria o NOT NULL da coluna; só age
+    # aceita null. O validador só roda para os campos enviados.
+    @field_validator(
+        'name', 'anime', 'hierarchy', 'abilities', 'notable_moments'
+    )
+    @classmethod
+    def check_not_null(cls, value):
+        if value is None:
+            raise ValueError('Field cannot be null')
+        return value
+
+
+# Maior número de personagens alterados ou apagados numa só requisição
+MAX_BATCH_SIZE = 1000
+
+
+class CharacterBatchPatch(CharacterUpdate):
+    id: int
+
+    @model_validator(mode='after')
+    def check_changes(self):
+        if not self.model_fields_set - {'id'}:
+            raise ValueError('Patch must change at least one field')
+        return self
+
+
+class CharacterBatchUpdate(BaseModel):
+    characters: list[CharacterBatchPatch] = Field(
+        min_length=1, max_length=MAX_BATCH_SIZE
+    )
+
+
+class CharacterBatchDelete(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class CharacterBatchResult(BaseModel):
+    id: int
+    status: Literal['updated', 'deleted', 'not_found']
+
+
+class CharacterBatchReport(BaseModel):
+    results: list[CharacterBatchResult]  # Na ordem em que os ids vieram
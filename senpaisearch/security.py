@@ -1,33 +1,146 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from functools import lru_cache
 from http import HTTPStatus
+from zoneinfo import ZoneInfo
 
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jwt import decode, encode
 from jwt.exceptions import DecodeError, ExpiredSignatureError
 from pwdlib import PasswordHash
-from sqlalchemy import select
-from sqlalchemy.orm import Session
-from zoneinfo import ZoneInfo
+from pwdlib.exceptions import UnknownHashError
+from pwdlib.hashers.argon2 import Argon2Hasher
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from senpaisearch.database import get_session
+from senpaisearch.cache import TTLCache
+from senpaisearch.database import get_read_session, set_request_user
+from senpaisearch.metrics import PASSWORD_HASH_DURATION
 from senpaisearch.models import User
-from senpaisearch.settings import Settings
+from senpaisearch.settings import get_settings
 
-pwd_context = PasswordHash.recommended()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='auth/token')
-settings = Settings()
 
 
-def get_password_hash(password: str):
-    return pwd_context.hash(password)
+# Criado no primeiro uso (ou no lifespan do app), não na importação
+@lru_cache
+def get_password_context() -> PasswordHash:
+    settings = get_settings()
+    return PasswordHash((
+        Argon2Hasher(
+            time_cost=settings.ARGON2_TIME_COST,
+            memory_cost=settings.ARGON2_MEMORY_COST,
+            parallelism=settings.ARGON2_PARALLELISM,
+        ),
+    ))
+
+
+# O Argon2 gasta dezenas de ms de CPU e MBs de memória por chamada. Ele roda
+# num executor só dele para que uma rajada de logins não ocupe o threadpool
+# compartilhado nem o event loop; o argon2-cffi libera o GIL enquanto
+# calcula, então threads bastam para usar vários núcleos.
+@lru_cache
+def get_password_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=get_settings().PASSWORD_HASH_WORKERS,
+        thread_name_prefix='argon2',
+    )
+
+
+def _timed(operation: str, func, *args):
+    # Medido dentro da thread: conta o cálculo, não a espera na fila
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        PASSWORD_HASH_DURATION.labels(operation).observe(
+            time.perf_counter() - start
+        )
+
+
+async def _run_password_task(operation: str, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_password_executor(), _timed, operation, func, *args
+    )
+
+
+def _verify_and_update(plain_password: str, hashed_password: str):
+    try:
+        return get_password_context().verify_and_update(
+            plain_password, hashed_password
+        )
+    except UnknownHashError:
+        return False, None
+
+
+async def get_password_hash(password: str):
+    return await _run_password_task(
+        'hash', get_password_context().hash, password
+    )
+
+
+async def verify_password(plain_password: str, hashed_password: str):
+    valid, _ = await verify_and_update_password(
+        plain_password, hashed_password
+    )
+    return valid
+
+
+async def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    """Verifica a senha e devolve um novo hash se os parâmetros mudaram."""
+    return await _run_password_task(
+        'verify', _verify_and_update, plain_password, hashed_password
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """Usuário autenticado, sem vínculo com uma sessão do banco."""
 
+    id: int
+    username: str
+    email: str
+    token_version: int
 
-def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
+    @classmethod
+    def from_user(cls, user: User):
+        return cls(user.id, user.username, user.email, user.token_version)
+
+
+# Usuários autenticados recentemente, por id. Evita ir ao banco a cada
+# requisição; quem altera ou remove um usuário deve invalidar a entrada.
+@lru_cache
+def get_principal_cache() -> TTLCache:
+    settings = get_settings()
+    return TTLCache(
+        maxsize=settings.AUTH_CACHE_MAXSIZE,
+        ttl=settings.AUTH_CACHE_TTL_SECONDS,
+    )
+
+
+def remember_user(user: User) -> Principal:
+    principal = Principal.from_user(user)
+    get_principal_cache().set(user.id, principal)
+    return principal
+
+
+def forget_user(user_id: int):
+    get_principal_cache().delete(user_id)
+
+
+def token_data(user: User | Principal) -> dict:
+    # uid e ver permitem validar o token sem consultar o usuário pelo email
+    return {'sub': user.email, 'uid': user.id, 'ver': user.token_version}
 
 
 def create_access_token(data: dict):
+    settings = get_settings()
     to_encode = data.copy()
 
     # Adiciona um tempo de 30 minutos para a expiração
@@ -42,8 +155,8 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 
-def get_current_user(
-    session: Session = Depends(get_session),
+async def get_current_user(
+    session: AsyncSession = Depends(get_read_session),
     token: str = Depends(oauth2_scheme),
 ):
     credentials_exception = HTTPException(
@@ -51,20 +164,34 @@ def get_current_user(
         detail='Could not validate credentials',
         headers={'WWW-Authenticate': 'Bearer'},
     )
+    settings = get_settings()
     try:
         payload = decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
         )
-        username: str = payload.get('sub')
-        if not username:
+        user_id = payload.get('uid')
+        version = payload.get('ver')
+        if not isinstance(user_id, int) or not isinstance(version, int):
             raise credentials_exception
     except ExpiredSignatureError:
         raise credentials_exception
     except DecodeError:
         raise credentials_exception
 
-    user_db = session.scalar(select(User).where(User.email == username))
-    if not user_db:
+    # Antes da consulta: quem escreveu há pouco lê do primário
+    await set_request_user(user_id)
+    principal = get_principal_cache().get(user_id)
+    if principal is None:
+        user_db = await session.get(User, user_id)
+        if not user_db:
+            raise credentials_exception
+        principal = remember_user(user_db)
+        # Devolve a conexão ao pool já: as rotas de escrita usam outra
+        # sessão (get_session) e segurariam duas conexões até o fim
+        await session.commit()
+
+    # Tokens emitidos antes da última troca de credenciais foram revogados
+    if principal.token_version != version:
         raise credentials_exception
 
-    return user_db
+    return principal
@@ -0,0 +1,132 @@
+"""Servidor de produção: gunicorn gerenciando vários workers uvicorn.
+
+O app é importado uma vez no processo principal (preload) e os workers
+nascem dele por fork, já com tudo carregado. Engine e hasher são criados no
+lifespan de cada worker, depois do fork, então nenhum pool de conexões é
+herdado. No SIGTERM o gunicorn para de aceitar conexões e espera as
+requisições em andamento terminarem.
+
+Uso: senpaisearch-serve (configurado pelas variáveis SERVER_* do Settings)
+"""
+
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from gunicorn.app.base import BaseApplication
+from gunicorn.util import import_app
+from uvicorn_worker import UvicornWorker
+
+from senpaisearch.settings import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+# Onde o prometheus_client grava as métricas de cada processo
+METRICS_DIR_VARIABLE = 'PROMETHEUS_MULTIPROC_DIR'
+
+
+class Worker(UvicornWorker):
+    # uvloop e httptools vêm com o fastapi[standard] (uvicorn[standard])
+    CONFIG_KWARGS = {'loop': 'uvloop', 'http': 'httptools'}
+
+
+def cpu_count() -> int:
+    # A afinidade respeita o cpuset do container, ao contrário de cpu_count()
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def child_exit(server, worker):
+    # Tira das métricas os gauges do worker que saiu (reciclado ou morto)
+    from prometheus_client import multiprocess  # noqa: PLC0415
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def server_options(settings: Settings) -> dict:
+    return {
+        'bind': settings.SERVER_BIND,
+        'workers': settings.SERVER_WORKERS or cpu_count(),
+        'worker_class': Worker,
+        'backlog': settings.SERVER_BACKLOG,
+        'keepalive': settings.SERVER_KEEPALIVE_SECONDS,
+        'timeout': settings.SERVER_TIMEOUT_SECONDS,
+        'max_requests': settings.SERVER_MAX_REQUESTS,
+        'max_requests_jitter': settings.SERVER_MAX_REQUESTS_JITTER,
+        'graceful_timeout': settings.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        'preload_app': True,
+        'child_exit': child_exit,
+    }
+
+
+def check_settings(settings: Settings, workers: int):
+    """Recusa configurações que só funcionam com um processo.
+
+    O cache das listagens em memória é desligado com mais de um worker: a
+    invalidação de uma escrita só chegaria ao worker que a recebeu e os
+    outros serviriam a listagem antiga até o TTL.
+    """
+    if workers > 1 and not settings.CACHE_URL and settings.CACHE_ENABLED:
+        logger.warning(
+            'Response cache disabled: %d workers without CACHE_URL', workers
+        )
+        settings.CACHE_ENABLED = False
+
+    if (
+        workers > 1
+        and settings.DATABASE_REPLICA_URLS
+        and not settings.CACHE_URL
+    ):
+        # Sem um backend compartilhado, a marca de quem escreveu há pouco
+        # fica no worker que recebeu a escrita e a leitura seguinte, em
+        # outro worker, pode ir a uma réplica atrasada
+        raise SystemExit(
+            'DATABASE_REPLICA_URLS with more than one worker requires '
+            'CACHE_URL to share read-your-writes markers between workers'
+        )
+
+
+def prepare_metrics_dir():
+    """Diretório das métricas compartilhadas entre os workers, vazio.
+
+    Precisa existir antes de o prometheus_client ser importado: é na
+    importação que ele decide gravar as métricas em arquivos.
+    """
+    directory = os.environ.get(METRICS_DIR_VARIABLE)
+    if not directory:
+        directory = tempfile.mkdtemp(prefix='senpaisearch-metrics-')
+        os.environ[METRICS_DIR_VARIABLE] = directory
+
+    # Arquivos de uma execução anterior somariam valores antigos
+    for path in Path(directory).glob('*.db'):
+        path.unlink()
+
+
+class Server(BaseApplication):
+    def __init__(self, app_uri: str, options: dict):
+        self.app_uri = app_uri
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Só aqui, depois de prepare_metrics_dir(), o app é importado
+        return import_app(self.app_uri)
+
+
+def main():
+    prepare_metrics_dir()
+    # Os workers nascem por fork e herdam este mesmo objeto
+    settings = get_settings()
+    options = server_options(settings)
+    check_settings(settings, options['workers'])
+    Server('senpaisearch.app:app', options).run()
+
+
+if __name__ == '__main__':
+    main()
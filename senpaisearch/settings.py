@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -9,3 +11,87 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+
+    # Servidor de produção (senpaisearch-serve): gunicorn com workers
+    # uvicorn. Cada worker tem o seu pool de conexões, então o banco recebe
+    # até workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) conexões.
+    SERVER_BIND: str = '0.0.0.0:8000'
+    SERVER_WORKERS: int = 0  # 0 usa um worker por CPU disponível
+    SERVER_BACKLOG: int = 2048  # Conexões na fila do accept()
+    # Deve passar do tempo ocioso do balanceador na frente (em geral 60 s),
+    # para ele não reaproveitar uma conexão que o worker acabou de fechar
+    SERVER_KEEPALIVE_SECONDS: int = 75
+    # O worker que fica esse tempo sem dar sinal (event loop travado) é
+    # morto e substituído pelo gunicorn
+    SERVER_TIMEOUT_SECONDS: int = 60
+    # Reinicia o worker depois de tantas requisições (+ até o jitter, para
+    # não reiniciarem todos juntos); 0 desativa
+    SERVER_MAX_REQUESTS: int = 10_000
+    SERVER_MAX_REQUESTS_JITTER: int = 1_000
+    # Tempo para terminar as requisições em andamento depois do SIGTERM
+    SERVER_GRACEFUL_TIMEOUT_SECONDS: int = 30
+
+    # Pool de conexões do SQLAlchemy (por worker)
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30  # Segundos esperando uma conexão livre
+    DB_POOL_RECYCLE: int = 1800  # Segundos até reciclar uma conexão
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 0  # 0 desativa o limite
+    # Consultas mais lentas que isso vão para o log com o EXPLAIN; 0 desativa
+    DB_SLOW_QUERY_MS: int = 0
+    # Usar com PgBouncer em modo transaction: o pool fica a cargo dele
+    DB_EXTERNAL_POOLER: bool = False
+
+    # Réplicas de leitura, em JSON: '["postgresql+psycopg://..."]'. As rotas
+    # só de leitura usam a réplica com menos conexões em uso; escritas vão
+    # sempre para o DATABASE_URL.
+    DATABASE_REPLICA_URLS: list[str] = []
+    # Depois de escrever, o usuário lê do primário por esse tempo (deve
+    # cobrir o atraso da replicação). A marca fica no CACHE_URL, obrigatório
+    # com réplicas e mais de um worker.
+    DB_REPLICA_STICKY_SECONDS: float = 5
+    # Uma réplica que falhou fica fora do rodízio por esse tempo
+    DB_REPLICA_RETRY_SECONDS: float = 10
+
+    # Parâmetros do Argon2 (padrões do RFC 9106); mudar qualquer um faz
+    # os hashes antigos serem refeitos no próximo login de cada usuário
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536  # KiB
+    ARGON2_PARALLELISM: int = 4
+    # Hashes calculados ao mesmo tempo (limita CPU e memória do Argon2)
+    PASSWORD_HASH_WORKERS: int = 2
+
+    # Cache em memória dos usuários autenticados (por worker). Uma revogação
+    # feita em outro worker leva até AUTH_CACHE_TTL_SECONDS para valer nele.
+    AUTH_CACHE_TTL_SECONDS: float = 60
+    AUTH_CACHE_MAXSIZE: int = 10_000
+
+    # Cache das listagens de personagens. Sem CACHE_URL o cache é local do
+    # worker e só serve com um processo: a invalidação de uma escrita não
+    # chegaria aos outros, então o senpaisearch-serve o desliga quando sobe
+    # mais de um worker. Com redis://... ele é compartilhado (extra "redis")
+    CACHE_URL: str | None = None
+    CACHE_ENABLED: bool = True
+    CACHE_TTL_SECONDS: int = 30
+    CACHE_MAXSIZE: int = 10_000
+
+    # Sugestões da busca (autocomplete) em memória, por usuário e por
+    # worker. Escritas de outros workers aparecem em até esse TTL.
+    AUTOCOMPLETE_TTL_SECONDS: float = 300
+    AUTOCOMPLETE_MAXSIZE: int = 10_000  # Usuários mantidos em memória
+
+    # Snapshot do índice de personagens parecidos, gerado com
+    # "python -m senpaisearch.similarity <diretório>" e mapeado em memória
+    # (compartilhado entre os workers). Sem ele o índice é montado do banco
+    # no primeiro pedido de cada worker.
+    SIMILARITY_SNAPSHOT_DIR: str | None = None
+    # De quanto em quanto tempo cada worker busca os personagens criados ou
+    # alterados (por ele ou pelos outros) desde a última vez
+    SIMILARITY_REFRESH_SECONDS: float = 30
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Configuração do processo, lida (com o .env) uma única vez."""
+    return Settings()
@@ -0,0 +1,579 @@
+"""Personagens parecidos pelo texto de abilities e notable_moments.
+
+Cada personagem vira um vetor TF-IDF esparso, com os termos mapeados para
+colunas por hashing (sem vocabulário para guardar), e a similaridade é o
+cosseno entre os vetores. O índice pode ser salvo em disco e carregado com
+memory map, para os workers subirem sem recalcular nada:
+
+    python -m senpaisearch.similarity <diretório>
+"""
+
+import asyncio
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from senpaisearch.autocomplete import normalize
+from senpaisearch.database import get_engine
+from senpaisearch.models import Character
+from senpaisearch.settings import get_settings
+
+# Colunas do hashing: com 2**20 as colisões entre termos ficam raras
+N_FEATURES = 2**20
+# Escritas ficam numa matriz à parte até passarem desse número
+COMPACT_THRESHOLD = 10_000
+LOAD_BATCH_SIZE = 10_000
+# Quanto antes da última atualização a seguinte volta a buscar: uma
+# transação iniciada antes dela pode ter confirmado depois
+CATCH_UP_OVERLAP = timedelta(minutes=1)
+COLUMNS = (
+    Character.id,
+    Character.user_id,
+    Character.abilities,
+    Character.notable_moments,
+)
+
+
+def document(abilities: str, notable_moments: str) -> str:
+    return f'{abilities} {notable_moments}'
+
+
+def term_counts(text: str) -> dict[int, int]:
+    """Quantas vezes cada termo (já como coluna do hashing) aparece."""
+    counts = {}
+    for word in normalize(text).split():
+        term = ''.join(c for c in word if c.isalnum())
+        if len(term) > 1:
+            # crc32 é igual em todo processo, ao contrário de hash()
+            column = zlib.crc32(term.encode()) % N_FEATURES
+            counts[column] = counts.get(column, 0) + 1
+    return counts
+
+
+def count_matrix(documents: list[dict[int, int]]) -> sparse.csr_matrix:
+    """Uma linha por documento com quantas vezes cada termo aparece."""
+    sizes = [len(counts) for counts in documents]
+    indptr = np.zeros(len(documents) + 1, np.int64)
+    indptr[1:] = np.cumsum(sizes)
+    indices = np.fromiter(
+        (column for counts in documents for column in counts),
+        np.int32,
+        count=indptr[-1],
+    )
+    tf = np.fromiter(
+        (count for counts in documents for count in counts.values()),
+        np.float32,
+        count=indptr[-1],
+    )
+
+    return sparse.csr_matrix(
+        (tf, indices, indptr), shape=(len(documents), N_FEATURES)
+    )
+
+
+def weigh(counts: sparse.csr_matrix, idf) -> sparse.csr_matrix:
+    """TF-IDF (tf sublinear) de norma 1 para cada linha de contagens."""
+    data = (1 + np.log(counts.data)) * idf[counts.indices]
+
+    rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+    norms = np.sqrt(np.bincount(rows, data**2, minlength=counts.shape[0]))
+    data /= norms[rows].astype(np.float32)
+
+    return sparse.csr_matrix(
+        (data, counts.indices, counts.indptr), shape=counts.shape
+    )
+
+
+def vectorize(documents: list[dict[int, int]], idf) -> sparse.csr_matrix:
+    """Uma linha TF-IDF (tf sublinear) de norma 1 por documento."""
+    return weigh(count_matrix(documents), idf)
+
+
+def vectorize_texts(texts: list[str], idf) -> sparse.csr_matrix:
+    return vectorize([term_counts(text) for text in texts], idf)
+
+
+def _empty():
+    return sparse.csr_matrix((0, N_FEATURES), dtype=np.float32)
+
+
+def _by_owner(ids, user_ids, matrix) -> tuple:
+    """Linhas em ordem de (user_id, id): as de cada usuário ficam juntas."""
+    order = np.lexsort((ids, user_ids))
+    return (
+        np.asarray(ids)[order].astype(np.int64),
+        np.asarray(user_ids)[order].astype(np.int64),
+        matrix[order],
+    )
+
+
+def _top_k(ids, scores, k: int) -> list[tuple[int, float]]:
+    if len(ids) > k:
+        # argpartition separa os k maiores em O(n); só eles são ordenados
+        best = np.argpartition(-scores, k)[:k]
+        ids, scores = ids[best], scores[best]
+    order = np.lexsort((ids, -scores))
+    return [(int(ids[i]), float(scores[i])) for i in order]
+
+
+class IndexBuilder:
+    """Monta as matrizes do índice a partir de lotes de linhas.
+
+    Cada lote vira na hora uma matriz de contagens, sem guardar os textos;
+    o IDF depende de todas as linhas e só é aplicado em finish().
+    """
+
+    def __init__(self):
+        self.ids: list[int] = []
+        self.user_ids: list[int] = []
+        self.counts: list[sparse.csr_matrix] = []
+        self.df = np.zeros(N_FEATURES, np.int64)
+
+    def add(self, rows):
+        """Acrescenta um lote de (id, user_id, texto), em ordem de id."""
+        documents = []
+        for character_id, user_id, text in rows:
+            self.ids.append(character_id)
+            self.user_ids.append(user_id)
+            documents.append(term_counts(text))
+
+        counts = count_matrix(documents)
+        # Um termo aparece no máximo uma vez em cada linha de counts
+        self.df += np.bincount(counts.indices, minlength=N_FEATURES)
+        self.counts.append(counts)
+
+    def finish(self) -> tuple:
+        """ids, user_ids, matriz, idf e índice invertido, para _reset()."""
+        counts = sparse.vstack([_empty(), *self.counts], format='csr')
+        idf = np.log((1 + len(self.ids)) / (1 + self.df)) + 1
+        idf = idf.astype(np.float32)
+        ids, user_ids, matrix = _by_owner(
+            self.ids, self.user_ids, weigh(counts, idf)
+        )
+
+        return ids, user_ids, matrix, idf, matrix.T.tocsr()
+
+
+class SimilarityIndex:
+    """Índice invertido dos vetores TF-IDF, em memória (por worker).
+
+    Guarda a matriz personagem x termo (de onde saem os vetores consultados)
+    e a transposta termo x personagem, que é o índice invertido. As linhas
+    ficam em ordem de (user_id, id), então os personagens de um usuário são
+    um trecho contíguo de colunas em cada lista do índice invertido. Uma
+    consulta só percorre, nas listas dos termos que o vetor tem, o trecho
+    do dono: o custo acompanha os personagens dele, e não o milhão de
+    linhas do índice. O cálculo roda numa thread, fora do event loop.
+
+    Escritas não refazem as matrizes: a versão antiga da linha é marcada
+    como removida e a nova vai para `recent`, que entra em toda consulta
+    até ser incorporada (compact). O IDF é o da construção; só um índice
+    remontado ou um snapshot novo o atualizam.
+
+    Montar o índice e compactá-lo gasta segundos de CPU com muitos
+    personagens: os dois rodam numa thread, sem travar o event loop (nem o
+    heartbeat do worker no gunicorn), e um lock garante que cada worker
+    faça uma carga ou compactação de cada vez.
+
+    Cada worker aplica as próprias escritas na hora e as dos outros a cada
+    SIMILARITY_REFRESH_SECONDS, buscando as linhas por updated_at. Um
+    personagem apagado em outro worker sai do índice quando aparece numa
+    resposta e não é mais encontrado no banco.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.loaded = False
+        # Horário do banco da última busca por alterações, e quando ela foi
+        self.updated_since: datetime | None = None
+        self.refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+        # Escritas feitas durante uma compactação, para reaplicar depois
+        self._journal: list[tuple] | None = None
+        self._reset(
+            np.empty(0, np.int64),
+            np.empty(0, np.int64),
+            _empty(),
+            np.ones(N_FEATURES, np.float32),
+        )
+
+    def _reset(self, ids, user_ids, matrix, idf, postings=None):
+        # Ordenados por (user_id, id), para achar as linhas com searchsorted.
+        # Nunca são alterados, só trocados: uma consulta em andamento numa
+        # thread continua com a versão que recebeu
+        self.ids = ids
+        self.user_ids = user_ids
+        self.matrix = matrix
+        self.postings = matrix.T.tocsr() if postings is None else postings
+        self.idf = idf
+        self.removed: set[int] = set()
+        self.recent: dict[int, tuple[int, sparse.csr_matrix]] = {}
+        self.max_id = int(ids.max()) if len(ids) else 0
+
+    def build(self, rows):
+        """Monta o índice a partir de (id, user_id, texto) ordenados por id."""
+        builder = IndexBuilder()
+        builder.add(rows)
+        self._reset(*builder.finish())
+        self.loaded = True
+
+    def _refresh_due(self) -> bool:
+        elapsed = time.monotonic() - self.refreshed_at
+        return elapsed >= get_settings().SIMILARITY_REFRESH_SECONDS
+
+    async def ensure_loaded(self, session: AsyncSession):
+        """Carrega o índice no primeiro uso e o mantém em dia.
+
+        Quem chega durante a carga espera por ela em vez de montar outra;
+        durante uma atualização ou compactação as consultas seguem com o
+        índice atual.
+        """
+        pending = self._refresh_due() or len(self.recent) > COMPACT_THRESHOLD
+        if self.loaded and (not pending or self._lock.locked()):
+            return
+
+        async with self._lock:
+            if not self.loaded:
+                # Com snapshot o worker só mapeia os arquivos; sem snapshot
+                # monta tudo do banco. Nos dois casos busca em seguida o que
+                # mudou depois
+                snapshot = get_settings().SIMILARITY_SNAPSHOT_DIR
+                if snapshot and Path(snapshot, 'ids.npy').exists():
+                    self.load(snapshot)
+                else:
+                    await self.load_from_database(session)
+                await self._catch_up(session)
+            elif self._refresh_due():
+                await self._catch_up(session)
+            if len(self.recent) > COMPACT_THRESHOLD:
+                await self.compact()
+
+    async def load_from_database(self, session: AsyncSession):
+        """Monta o índice lendo os personagens do banco em lotes.
+
+        Só o lote atual fica em memória como texto; contar os termos e
+        montar as matrizes roda numa thread.
+        """
+        loop = asyncio.get_running_loop()
+        builder = IndexBuilder()
+        # Antes da leitura: o que mudar durante a montagem vem no catch_up
+        updated_since = await session.scalar(select(func.now()))
+        result = await session.stream(
+            select(*COLUMNS)
+            .order_by(Character.id)
+            .execution_options(yield_per=LOAD_BATCH_SIZE)
+        )
+        async for rows in result.partitions():
+            batch = [
+                (character_id, user_id, document(abilities, moments))
+                for character_id, user_id, abilities, moments in rows
+            ]
+            await loop.run_in_executor(None, builder.add, batch)
+
+        self._reset(*await loop.run_in_executor(None, builder.finish))
+        self.updated_since = updated_since
+        self.loaded = True
+
+    async def catch_up(self, session: AsyncSession):
+        """Indexa os personagens criados ou alterados desde a última busca.
+
+        Usado depois da importação em lote, que não devolve as linhas
+        criadas; as outras atualizações acontecem em ensure_loaded().
+        """
+        # Índice ainda não carregado: a carga já vai ler do banco
+        if not self.loaded:
+            return
+
+        async with self._lock:
+            await self._catch_up(session)
+
+    async def _catch_up(self, session: AsyncSession):
+        now = await session.scalar(select(func.now()))
+        if self.updated_since is None:
+            # Snapshot sem a data de geração: só os ids novos
+            changed = Character.id > self.max_id
+        else:
+            changed = Character.updated_at > (
+                self.updated_since - CATCH_UP_OVERLAP
+            )
+
+        loop = asyncio.get_running_loop()
+        result = await session.stream(
+            select(*COLUMNS)
+            .where(changed)
+            .execution_options(yield_per=LOAD_BATCH_SIZE)
+        )
+        async for rows in result.partitions():
+            vectors = await loop.run_in_executor(
+                None,
+                vectorize_texts,
+                [
+                    document(abilities, moments)
+                    for _, _, abilities, moments in rows
+                ],
+                self.idf,
+            )
+            for row, (character_id, user_id, _, _) in enumerate(rows):
+                self._put(user_id, character_id, vectors[row])
+
+        self.updated_since = now
+        self.refreshed_at = time.monotonic()
+
+    def save(self, user_id: int, character_id: int, text: str):
+        # Índice ainda não carregado: a carga já vai ler do banco
+        if not self.loaded:
+            return
+
+        self._put(
+            user_id, character_id, vectorize([term_counts(text)], self.idf)
+        )
+
+    def _put(self, user_id: int, character_id: int, row):
+        self._record('_put', user_id, character_id, row)
+        self._discard(user_id, character_id)
+        self.recent[character_id] = (user_id, row)
+        self.max_id = max(self.max_id, character_id)
+
+    def remove(self, user_id: int, character_id: int):
+        self._record('remove', user_id, character_id)
+        self._discard(user_id, character_id)
+
+    def _discard(self, user_id: int, character_id: int):
+        if self.recent.pop(character_id, None) is None:
+            if self._position(user_id, character_id) is not None:
+                self.removed.add(character_id)
+
+    def _record(self, *operation):
+        if self._journal is not None:
+            self._journal.append(operation)
+
+    async def compact(self):
+        """Incorpora as escritas pendentes às matrizes principais.
+
+        As matrizes novas são montadas numa thread a partir de uma cópia das
+        escritas pendentes; as que chegam enquanto isso são reaplicadas por
+        cima do resultado.
+        """
+        recent, removed = dict(self.recent), set(self.removed)
+        self._journal = []
+        try:
+            merged = await asyncio.get_running_loop().run_in_executor(
+                None, self._merged, recent, removed
+            )
+        finally:
+            journal, self._journal = self._journal, None
+
+        self._reset(*merged)
+        for method, *args in journal:
+            getattr(self, method)(*args)
+
+    def _merged(self, recent: dict, removed: set) -> tuple:
+        keep = ~np.isin(self.ids, list(removed))
+        ids, user_ids, matrix = _by_owner(
+            np.concatenate([self.ids[keep], list(recent)]),
+            np.concatenate([
+                self.user_ids[keep],
+                [user_id for user_id, _ in recent.values()],
+            ]),
+            sparse.vstack(
+                [self.matrix[keep], *(row for _, row in recent.values())],
+                format='csr',
+            ),
+        )
+
+        return ids, user_ids, matrix, self.idf, matrix.T.tocsr()
+
+    def _rows(self, user_id: int) -> tuple[int, int]:
+        """Início e fim do trecho de linhas do usuário na matriz principal."""
+        start, end = np.searchsorted(self.user_ids, [user_id, user_id + 1])
+        return int(start), int(end)
+
+    def _position(self, user_id: int, character_id: int) -> int | None:
+        start, end = self._rows(user_id)
+        position = start + int(
+            np.searchsorted(self.ids[start:end], character_id)
+        )
+        if position < end and self.ids[position] == character_id:
+            return position
+        return None
+
+    def _vector(self, character_id: int, user_id: int):
+        if character_id in self.recent:
+            owner, row = self.recent[character_id]
+            return row if owner == user_id else None
+
+        position = self._position(user_id, character_id)
+        if position is None or character_id in self.removed:
+            return None
+        return self.matrix[position]
+
+    async def similar(
+        self, character_ids: list[int], user_id: int, k: int
+    ) -> dict[int, list[tuple[int, float]]]:
+        """Os k personagens do usuário mais parecidos com cada id, com o
+        cosseno de cada um.
+
+        Ids que não existem ou são de outro usuário ficam fora.
+        """
+        vectors = {
+            character_id: vector
+            for character_id in character_ids
+            if (vector := self._vector(character_id, user_id)) is not None
+        }
+        if not vectors:
+            return {}
+
+        # O estado é copiado aqui, no event loop: as escritas seguem
+        # alterando recent e removed enquanto a thread calcula
+        start, end = self._rows(user_id)
+        recent = {
+            character_id: row
+            for character_id, (owner, row) in self.recent.items()
+            if owner == user_id
+        }
+        removed = np.fromiter(self.removed, np.int64, len(self.removed))
+
+        return await asyncio.get_running_loop().run_in_executor(
+            None,
+            _rank,
+            vectors,
+            (self.ids[start:end], self.postings, slice(start, end)),
+            recent,
+            removed,
+            k,
+        )
+
+    def save_snapshot(self, directory: str):
+        self._reset(*self._merged(self.recent, self.removed))
+        arrays = {
+            'ids': self.ids,
+            'user_ids': self.user_ids,
+            'idf': self.idf,
+        }
+        if self.updated_since is not None:
+            arrays['updated_since'] = np.array([
+                self.updated_since.timestamp()
+            ])
+        for name in ('matrix', 'postings'):
+            csr = getattr(self, name)
+            arrays[f'{name}_data'] = csr.data
+            arrays[f'{name}_indices'] = csr.indices
+            arrays[f'{name}_indptr'] = csr.indptr
+
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(path / f'{name}.npy', array)
+
+    def load(self, directory: str):
+        # mmap_mode='r': as páginas são lidas do disco sob demanda e ficam
+        # no cache do sistema, compartilhadas por todos os workers
+        def array(name):
+            return np.load(Path(directory, f'{name}.npy'), mmap_mode='r')
+
+        def csr(name, shape):
+            return sparse.csr_matrix(
+                (
+                    array(f'{name}_data'),
+                    array(f'{name}_indices'),
+                    array(f'{name}_indptr'),
+                ),
+                shape=shape,
+                copy=False,
+            )
+
+        ids, user_ids = array('ids'), array('user_ids')
+        matrix = csr('matrix', (len(ids), N_FEATURES))
+        if np.any(np.diff(user_ids) < 0):
+            # Snapshot antigo, em ordem de id: reordenado em memória (sem o
+            # compartilhamento do memory map até gerar um novo)
+            self._reset(*_by_owner(ids, user_ids, matrix), array('idf'))
+        else:
+            self._reset(
+                ids,
+                user_ids,
+                matrix,
+                array('idf'),
+                csr('postings', (N_FEATURES, len(ids))),
+            )
+        self.updated_since = None
+        if Path(directory, 'updated_since.npy').exists():
+            self.updated_since = datetime.fromtimestamp(
+                float(array('updated_since')[0]), ZoneInfo('UTC')
+            )
+        self.loaded = True
+
+
+def _user_scores(queries, postings, rows: slice) -> np.ndarray:
+    """Cosseno de cada consulta (coluna) com as linhas do trecho rows.
+
+    Só percorre as listas dos termos das consultas e, em cada uma, só as
+    colunas do trecho: elas estão em ordem e saem com searchsorted.
+    """
+    scores = np.zeros((rows.stop - rows.start, queries.shape[0]), np.float32)
+    for column in range(queries.shape[0]):
+        first, last = queries.indptr[column], queries.indptr[column + 1]
+        for term, weight in zip(
+            queries.indices[first:last], queries.data[first:last]
+        ):
+            start, end = postings.indptr[term], postings.indptr[term + 1]
+            docs = postings.indices[start:end]
+            low, high = np.searchsorted(docs, [rows.start, rows.stop])
+            scores[docs[low:high] - rows.start, column] += (
+                weight * postings.data[start + low : start + high]
+            )
+    return scores
+
+
+def _rank(vectors: dict, main: tuple, recent: dict, removed, k: int):
+    """Os k vizinhos de cada vetor entre os personagens de um usuário.
+
+    main traz os ids, o índice invertido e o trecho (slice) das colunas do
+    usuário nele; recent, as escritas dele ainda fora dela. Roda numa
+    thread.
+    """
+    ids, postings, rows = main
+    queries = sparse.vstack(list(vectors.values()), format='csr')
+    scores = _user_scores(queries, postings, rows)
+    # removed vale só para a matriz principal: um id alterado tem a linha
+    # antiga removida e a nova nas recentes
+    stale = np.isin(ids, removed)
+    if recent:
+        matrix = sparse.vstack(list(recent.values()), format='csr')
+        scores = np.vstack([scores, matrix @ queries.toarray().T])
+        stale = np.concatenate([stale, np.zeros(len(recent), bool)])
+        ids = np.concatenate([ids, list(recent)])
+    ids = ids.astype(np.int64)
+
+    results = {}
+    for column, character_id in enumerate(vectors):
+        values = scores[:, column]
+        valid = (values > 0) & (ids != character_id) & ~stale
+        results[character_id] = _top_k(ids[valid], values[valid], k)
+
+    return results
+
+
+similarity_index = SimilarityIndex()
+
+
+async def build_snapshot(directory: str):
+    engine = get_engine()
+    async with AsyncSession(engine) as session:
+        await similarity_index.load_from_database(session)
+    similarity_index.save_snapshot(directory)
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(build_snapshot(sys.argv[1]))
@@ -1,14 +1,24 @@
+from contextlib import contextmanager
+
 import factory
 import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from testcontainers.postgres import PostgresContainer
 
 from senpaisearch.app import app
-from senpaisearch.database import get_session
+from senpaisearch.autocomplete import get_autocomplete_index
+from senpaisearch.cache import get_response_cache
+from senpaisearch.database import (
+    get_read_session,
+    get_session,
+    track_queries,
+)
 from senpaisearch.models import Character, User, table_registry
-from senpaisearch.security import get_password_hash
+from senpaisearch.security import get_password_hash, get_principal_cache
+from senpaisearch.similarity import similarity_index
 
 
 class UserFactory(factory.Factory):
@@ -33,13 +43,20 @@ class CharacterFactory(factory.Factory):
     user_id = 1
 
 
-@pytest.fixture
-def client(session):
+@pytest_asyncio.fixture
+async def client(session):
     def get_session_override():
         return session
 
+    # Os ids recomeçam a cada teste, então os caches não podem sobreviver a ele
+    get_principal_cache().clear()
+    get_autocomplete_index().clear()
+    similarity_index.clear()
+    await get_response_cache().clear()
+
     with TestClient(app) as client:
         app.dependency_overrides[get_session] = get_session_override
+        app.dependency_overrides[get_read_session] = get_session_override
 
         yield client
 
@@ -49,44 +66,47 @@ def client(session):
 @pytest.fixture(scope='session')
 def engine():
     with PostgresContainer('postgres:17', driver='psycopg') as postgres:
-        _engine = create_engine(postgres.get_connection_url())
+        _engine = create_async_engine(postgres.get_connection_url())
+        # Contagem de consultas por requisição, como no engine da aplicação
+        track_queries(_engine.sync_engine)
 
-        with _engine.begin():
-            yield _engine
+        yield _engine
 
 
-@pytest.fixture
-def session(engine):
-    table_registry.metadata.create_all(engine)
+@pytest_asyncio.fixture
+async def session(engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
 
-    with Session(engine) as session:
+    async with AsyncSession(engine, expire_on_commit=False) as session:
         yield session
 
-    table_registry.metadata.drop_all(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.drop_all)
 
 
-@pytest.fixture
-def user(session):
+@pytest_asyncio.fixture
+async def user(session):
     pwd = 'testtest'
-    user = UserFactory(password=get_password_hash(pwd))
+    user = UserFactory(password=await get_password_hash(pwd))
 
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
 
     user.clean_password = pwd
 
     return user
 
 
-@pytest.fixture
-def user_fun(session):
+@pytest_asyncio.fixture
+async def user_fun(session):
     password = 'testtest'
-    user = UserFactory(password=get_password_hash(password))
+    user = UserFactory(password=await get_password_hash(password))
 
     session.add(user)
-    session.commit()
-    session.refresh(user)
+    await session.commit()
+    await session.refresh(user)
 
     user.clean_password = 'testtest'
 
@@ -100,3 +120,33 @@ def token(client, user):
         data={'username': user.email, 'password': user.clean_password},
     )
     return response.json()['access_token']
+
+
+@pytest.fixture
+def assert_max_queries(engine):
+    """Falha se o bloco fizer mais consultas ao banco que o orçamento.
+
+    Uso: with assert_max_queries(2): client.get(...)
+    """
+
+    @contextmanager
+    def assert_max_queries(limit: int):
+        statements = []
+
+        def record(statement, **kw):
+            statements.append(statement)
+
+        event.listen(
+            engine.sync_engine, 'after_cursor_execute', record, named=True
+        )
+        try:
+            yield statements
+        finally:
+            event.remove(engine.sync_engine, 'after_cursor_execute', record)
+
+        assert len(statements) <= limit, (
+            f'{len(statements)} queries (limit {limit}):\n'
+            + '\n'.join(statements)
+        )
+
+    return assert_max_queries
@@ -1,7 +1,24 @@
+import json
 from http import HTTPStatus
 
+from benchmarks.imports import run_child
+
 
 def test_read_root_deve_retornar_OK(client):
     response = client.get('/')  # Act (Excuta o teste)
     assert response.status_code == HTTPStatus.OK  # Assert (Afirmação do teste)
     assert response.json() == {'message': 'Olá mundo!'}
+
+
+def test_import_should_not_read_settings_or_create_engine():
+    # Num interpretador novo: neste processo o lifespan já criou tudo
+    report = json.loads(run_child().stdout)
+    del report['milliseconds']
+
+    assert report == {
+        'settings_created': False,
+        'engine_created': False,
+        'hasher_created': False,
+        'driver_loaded': False,
+        'numpy_loaded': False,
+    }
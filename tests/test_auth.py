@@ -1,6 +1,10 @@
 from http import HTTPStatus
 
+import pytest
 from freezegun import freeze_time
+from pwdlib.hashers.argon2 import Argon2Hasher
+
+from senpaisearch.settings import get_settings
 
 
 def test_get_token(client, user):
@@ -68,3 +72,37 @@ def test_refresh_token(client, user, token):
 
     assert response.status_code == HTTPStatus.OK
     assert 'access_token' in data
+
+
+@pytest.mark.asyncio
+async def test_get_token_should_rehash_outdated_password(
+    session, client, user
+):
+    # Hash gerado com parâmetros antigos (mais fracos) do Argon2
+    user.password = Argon2Hasher(time_cost=1).hash(user.clean_password)
+    await session.commit()
+
+    response = client.post(
+        '/auth/token',
+        data={'username': user.email, 'password': user.clean_password},
+    )
+    await session.refresh(user)
+
+    assert response.status_code == HTTPStatus.OK
+    assert f't={get_settings().ARGON2_TIME_COST}' in user.password
+
+
+@pytest.mark.asyncio
+async def test_get_token_should_reject_password_not_hashed(
+    session, client, user
+):
+    user.password = user.clean_password
+    await session.commit()
+
+    response = client.post(
+        '/auth/token',
+        data={'username': user.email, 'password': user.clean_password},
+    )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'detail': 'Incorrect email or password'}
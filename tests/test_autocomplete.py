@@ -0,0 +1,143 @@
+from http import HTTPStatus
+
+import pytest
+
+from senpaisearch.autocomplete import (
+    AutocompleteIndex,
+    PrefixIndex,
+    UserSuggestions,
+)
+from tests.conftest import CharacterFactory
+
+
+def test_prefix_index_should_match_word_starts_without_accents():
+    index = PrefixIndex()
+    for text in ['Naruto Uzumaki', 'Nagato', 'Capitão Kenpachi']:
+        index.add(text)
+
+    assert index.search('na', limit=10) == ['Nagato', 'Naruto Uzumaki']
+    assert index.search('UZU', limit=10) == ['Naruto Uzumaki']
+    assert index.search('capitao k', limit=10) == ['Capitão Kenpachi']
+    assert index.search('na', limit=1) == ['Nagato']
+
+
+def test_prefix_index_should_keep_repeated_texts_until_last_removal():
+    index = PrefixIndex()
+    index.add('Naruto')
+    index.add('Naruto')
+
+    index.remove('Naruto')
+    assert index.search('nar', limit=10) == ['Naruto']
+
+    index.remove('Naruto')
+    assert index.search('nar', limit=10) == []
+
+
+def test_prefix_index_should_build_in_bulk_like_one_by_one():
+    texts = ['Naruto Uzumaki', 'Nagato', 'Naruto', 'Naruto', 'Capitão Yamato']
+    incremental = PrefixIndex()
+    for text in texts:
+        incremental.add(text)
+
+    bulk = PrefixIndex.from_texts(texts)
+
+    for prefix in ['na', 'naruto', 'uzu', 'yama', 'capitao', 'x']:
+        assert bulk.search(prefix, limit=10) == incremental.search(
+            prefix, limit=10
+        )
+    # As contagens também vêm do lote: uma remoção não tira o repetido
+    bulk.remove('Naruto')
+    assert bulk.search('naruto', limit=10) == ['Naruto', 'Naruto Uzumaki']
+    bulk.remove('Naruto')
+    assert bulk.search('naruto', limit=10) == ['Naruto Uzumaki']
+
+
+def test_user_suggestions_should_accept_writes_after_bulk_build():
+    suggestions = UserSuggestions.from_rows([
+        (1, 'Rem', 'Re:Zero'),
+        (2, 'Ram', 'Re:Zero'),
+    ])
+
+    suggestions.add(1, 'Rem Oni', 'Re:Zero')
+    suggestions.remove(2)
+
+    assert suggestions.names.search('r', limit=10) == ['Rem Oni']
+    assert suggestions.anime.search('re', limit=10) == ['Re:Zero']
+
+
+@pytest.mark.asyncio
+async def test_autocomplete_index_should_keep_writes_made_while_building(
+    session, user
+):
+    session.add(CharacterFactory(user_id=user.id, name='Rem', anime='Re:Zero'))
+    await session.commit()
+    index = AutocompleteIndex(maxsize=10, ttl=60)
+    execute = session.execute
+
+    # Uma escrita chega entre a leitura das linhas e o fim da montagem
+    async def execute_then_write(*args, **kwargs):
+        result = await execute(*args, **kwargs)
+        index.save(user.id, 99, 'Ram', 'Re:Zero')
+        return result
+
+    session.execute = execute_then_write
+    await index.get(session, user.id)
+    session.execute = execute
+
+    suggestions = await index.get(session, user.id)
+    assert suggestions.names.search('r', limit=10) == ['Ram', 'Rem']
+
+
+@pytest.mark.asyncio
+async def test_autocomplete_should_answer_from_memory(
+    session, client, user, token, assert_max_queries
+):
+    session.add_all([
+        CharacterFactory(
+            user_id=user.id, name='Naruto Uzumaki', anime='Naruto'
+        ),
+        CharacterFactory(user_id=user.id, name='Sasuke', anime='Naruto'),
+        CharacterFactory(user_id=user.id, name='Ichigo', anime='Bleach'),
+    ])
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    # O primeiro pedido monta o índice do usuário a partir do banco
+    response = client.get('/characters/autocomplete?q=na', headers=headers)
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        'names': ['Naruto Uzumaki'],
+        'anime': ['Naruto'],
+    }
+
+    with assert_max_queries(0):
+        response = client.get('/characters/autocomplete?q=b', headers=headers)
+    assert response.json() == {'names': [], 'anime': ['Bleach']}
+
+
+@pytest.mark.asyncio
+async def test_autocomplete_should_follow_character_writes(
+    session, client, user, token
+):
+    session.add(CharacterFactory(user_id=user.id, name='Rem', anime='Re:Zero'))
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+    client.get('/characters/autocomplete?q=r', headers=headers)
+
+    client.post(
+        '/characters/',
+        headers=headers,
+        json={
+            'name': 'Ram',
+            'anime': 'Re:Zero',
+            'hierarchy': 'Maid',
+            'abilities': 'Magia de vento',
+            'notable_moments': 'Arco 2',
+        },
+    )
+    client.patch('/characters/1', headers=headers, json={'name': 'Rem Oni'})
+    client.delete('/characters/2', headers=headers)
+
+    response = client.get('/characters/autocomplete?q=r', headers=headers)
+
+    assert response.json() == {'names': ['Rem Oni'], 'anime': ['Re:Zero']}
@@ -0,0 +1,95 @@
+from fnmatch import fnmatchcase
+
+import pytest
+from freezegun import freeze_time
+
+from senpaisearch.cache import (
+    MemoryBackend,
+    RedisBackend,
+    ResponseCache,
+    TTLCache,
+    create_response_cache,
+)
+from senpaisearch.settings import Settings
+
+
+class FakeRedis:
+    """Só a parte da interface assíncrona do redis-py usada pelo backend."""
+
+    def __init__(self, items: dict):
+        self.items = items
+
+    async def get(self, key):
+        return self.items.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.items[key] = value
+
+    async def scan_iter(self, match, count):
+        for key in list(self.items):
+            if fnmatchcase(key, match):
+                yield key
+
+    async def delete(self, *keys):
+        for key in keys:
+            del self.items[key]
+
+
+def test_ttl_cache_should_expire_items():
+    cache = TTLCache(maxsize=10, ttl=60)
+
+    with freeze_time('2024-01-01 12:00:00'):
+        cache.set('key', 'value')
+
+        assert cache.get('key') == 'value'
+
+    with freeze_time('2024-01-01 12:01:01'):
+        assert cache.get('key') is None
+
+
+def test_ttl_cache_should_evict_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 'first')
+    cache.set('b', 'second')
+    cache.get('a')
+
+    cache.set('c', 'third')
+
+    assert cache.get('a') == 'first'
+    assert cache.get('b') is None
+    assert cache.get('c') == 'third'
+
+
+@pytest.mark.asyncio
+async def test_response_cache_invalidate_should_hide_old_entries():
+    cache = ResponseCache(MemoryBackend(maxsize=10, ttl=60), ttl=60)
+    key = await cache.key('characters:1', 'limit=10')
+    await cache.set(key, b'{"characters":[]}')
+
+    await cache.invalidate('characters:1')
+
+    assert await cache.get(key) == b'{"characters":[]}'
+    assert await cache.get(await cache.key('characters:1', 'limit=10')) is None
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_clear_should_keep_other_keys():
+    client = FakeRedis({'session:1': b'other service'})
+    backend = RedisBackend(client, prefix='senpaisearch:cache:')
+    # Apaga em mais de um lote
+    backend.DELETE_BATCH = 2
+    for n in range(5):
+        await backend.set(f'characters:{n}', b'[]', ttl=60)
+
+    await backend.clear()
+
+    assert client.items == {'session:1': b'other service'}
+
+
+@pytest.mark.asyncio
+async def test_response_cache_should_store_nothing_when_disabled():
+    cache = create_response_cache(Settings(CACHE_ENABLED=False))
+    key = await cache.key('characters:1', 'limit=10')
+    await cache.set(key, b'{"characters":[]}')
+
+    assert await cache.get(key) is None
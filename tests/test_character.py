@@ -1,21 +1,30 @@
+import csv
+import io
+import json
 from http import HTTPStatus
 
-from tests.conftest import CharacterFactory
+import pytest
 
+from senpaisearch.bulk_import import iter_lines
+from tests.conftest import CharacterFactory, UserFactory
 
-def test_create_character(client, token):
-    response = client.post(
-        '/characters/',
-        headers={'Authorization': f'Bearer {token}'},
-        json={
-            'name': 'tales',
-            'age': 29,
-            'anime': 'entropia',
-            'hierarchy': 'Vilão',
-            'abilities': 'Domínio quantico, MMA',
-            'notable_moments': 'Eliminou 17 traficantes apenas com as mãos',
-        },
-    )
+
+def test_create_character(client, token, assert_max_queries):
+    with assert_max_queries(1):
+        response = client.post(
+            '/characters/',
+            headers={'Authorization': f'Bearer {token}'},
+            json={
+                'name': 'tales',
+                'age': 29,
+                'anime': 'entropia',
+                'hierarchy': 'Vilão',
+                'abilities': 'Domínio quantico, MMA',
+                'notable_moments': (
+                    'Eliminou 17 traficantes apenas com as mãos'
+                ),
+            },
+        )
     assert response.status_code == HTTPStatus.OK
     assert response.json() == {
         'id': 1,
@@ -28,57 +37,149 @@ def test_create_character(client, token):
     }
 
 
-def test_list_characters_should_return_5_characters(
+@pytest.mark.asyncio
+async def test_list_characters_should_return_5_characters(
     session,
     client,
     user,
     token,
+    assert_max_queries,
 ):
     expected_characters = 5
-    session.bulk_save_objects(
-        CharacterFactory.create_batch(5, user_id=user.id)
-    )
-    session.commit()
+    session.add_all(CharacterFactory.create_batch(5, user_id=user.id))
+    await session.commit()
+
+    with assert_max_queries(1):
+        response = client.get(
+            '/characters/',
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+    assert len(response.json()['characters']) == expected_characters
+
+
+@pytest.mark.asyncio
+async def test_list_characters_pagination_should_return_2_characters(
+    session,
+    client,
+    user,
+    token,
+):
+    expected_characters = 2
+    session.add_all(CharacterFactory.create_batch(5, user_id=user.id))
+    await session.commit()
 
     response = client.get(
-        '/characters/',
+        '/characters/?limit=2',
         headers={'Authorization': f'Bearer {token}'},
     )
 
     assert len(response.json()['characters']) == expected_characters
 
 
-def test_list_characters_pagination_should_return_2_characters(
+@pytest.mark.asyncio
+async def test_list_characters_should_follow_next_cursor(
     session,
     client,
     user,
     token,
 ):
-    expected_characters = 2
-    session.bulk_save_objects(
-        CharacterFactory.create_batch(5, user_id=user.id)
+    session.add_all(CharacterFactory.create_batch(5, user_id=user.id))
+    await session.commit()
+
+    ids = []
+    url = '/characters/?limit=2'
+    while url:
+        response = client.get(
+            url, headers={'Authorization': f'Bearer {token}'}
+        ).json()
+        ids += [character['id'] for character in response['characters']]
+        cursor = response['next_cursor']
+        url = f'/characters/?limit=2&after={cursor}' if cursor else None
+
+    assert ids == [1, 2, 3, 4, 5]
+
+
+# Ordem esperada de cada sort=; no desempate o id segue o mesmo sentido
+SORTED_NAMES = {
+    'age': ['Kid', 'Twin A', 'Twin B', 'Elder', 'Ageless 1', 'Ageless 2'],
+    '-age': ['Ageless 2', 'Ageless 1', 'Elder', 'Twin B', 'Twin A', 'Kid'],
+    '-name': ['Twin B', 'Twin A', 'Kid', 'Elder', 'Ageless 2', 'Ageless 1'],
+}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('sort', SORTED_NAMES)
+async def test_list_characters_should_sort_across_pages(
+    session, client, user, token, sort
+):
+    # Idades repetidas e nulas testam o desempate pelo id no cursor
+    ages = {'Ageless 1': None, 'Kid': 10, 'Twin A': 20, 'Elder': 80}
+    ages.update({'Twin B': 20, 'Ageless 2': None})
+    session.add_all([
+        CharacterFactory(user_id=user.id, name=name, age=age)
+        for name, age in ages.items()
+    ])
+    await session.commit()
+
+    names = []
+    url = f'/characters/?limit=2&sort={sort}&fields=name'
+    while url:
+        response = client.get(
+            url, headers={'Authorization': f'Bearer {token}'}
+        ).json()
+        names += [character['name'] for character in response['characters']]
+        cursor = response['next_cursor']
+        url = (
+            f'/characters/?limit=2&sort={sort}&after={cursor}'
+            if cursor
+            else None
+        )
+
+    assert names == SORTED_NAMES[sort]
+
+
+@pytest.mark.asyncio
+async def test_list_characters_should_filter_by_values_and_age_range(
+    session, client, user, token
+):
+    session.add_all([
+        CharacterFactory(user_id=user.id, name='A', anime='Naruto', age=12),
+        CharacterFactory(user_id=user.id, name='B', anime='Bleach', age=15),
+        CharacterFactory(user_id=user.id, name='C', anime='Bleach', age=30),
+        CharacterFactory(user_id=user.id, name='D', anime='Naruto 2', age=13),
+    ])
+    await session.commit()
+
+    response = client.get(
+        '/characters/?anime=Naruto&anime=Bleach&age_min=10&age_max=20',
+        headers={'Authorization': f'Bearer {token}'},
     )
-    session.commit()
 
+    assert [c['name'] for c in response.json()['characters']] == ['A', 'B']
+
+
+def test_list_characters_should_reject_unknown_sort(client, token):
     response = client.get(
-        '/characters/?limit=2',
+        '/characters/?sort=abilities',
         headers={'Authorization': f'Bearer {token}'},
     )
 
-    assert len(response.json()['characters']) == expected_characters
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
 
 
-def test_list_characters_filter_anime_should_return_5_characters(
+@pytest.mark.asyncio
+async def test_list_characters_filter_anime_should_return_5_characters(
     session,
     client,
     user,
     token,
 ):
     expected_characters = 5
-    session.bulk_save_objects(
+    session.add_all(
         CharacterFactory.create_batch(5, user_id=user.id, anime='Monogatari 1')
     )
-    session.commit()
+    await session.commit()
 
     response = client.get(
         '/characters/?anime=Monogatari 1',
@@ -88,17 +189,18 @@ def test_list_characters_filter_anime_should_return_5_characters(
     assert len(response.json()['characters']) == expected_characters
 
 
-def test_list_characters_filter_hierarchy_should_return_5_characters(
+@pytest.mark.asyncio
+async def test_list_characters_filter_hierarchy_should_return_5_characters(
     session,
     client,
     user,
     token,
 ):
     expected_characters = 5
-    session.bulk_save_objects(
+    session.add_all(
         CharacterFactory.create_batch(5, user_id=user.id, hierarchy='Vilão')
     )
-    session.commit()
+    await session.commit()
 
     response = client.get(
         '/characters/?hierarchy=Vilão',
@@ -108,17 +210,142 @@ def test_list_characters_filter_hierarchy_should_return_5_characters(
     assert len(response.json()['characters']) == expected_characters
 
 
-def test_delete_character(session, client, user, token):
-    character = CharacterFactory(user_id=user.id)
-    session.add(character)
-    session.commit()
-    session.refresh(character)
+@pytest.mark.asyncio
+async def test_list_characters_should_project_requested_fields(
+    session,
+    client,
+    user,
+    token,
+):
+    session.add_all(CharacterFactory.create_batch(2, user_id=user.id))
+    await session.commit()
 
-    response = client.delete(
-        f'/characters/{character.id}',
+    response = client.get(
+        '/characters/?fields=name,age',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    for character in response.json()['characters']:
+        assert character.keys() == {'id', 'name', 'age'}
+
+
+@pytest.mark.asyncio
+async def test_list_characters_summary_should_return_summary_fields(
+    session,
+    client,
+    user,
+    token,
+):
+    session.add(CharacterFactory(user_id=user.id, name='Rem', anime='Re:Zero'))
+    await session.commit()
+
+    response = client.get(
+        '/characters/?fields=summary',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.json()['characters'] == [
+        {'id': 1, 'name': 'Rem', 'anime': 'Re:Zero'}
+    ]
+
+
+def test_list_characters_schema_should_allow_any_projection(client):
+    schemas = client.get('/openapi.json').json()['components']['schemas']
+    characters = schemas['CharacterList']['properties']['characters']
+
+    assert characters['items']['anyOf'][1] == {
+        '$ref': '#/components/schemas/CharacterProjection'
+    }
+    assert 'required' not in schemas['CharacterProjection']
+
+
+def test_list_characters_should_reject_unknown_fields(client, token):
+    response = client.get(
+        '/characters/?fields=name,password',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_character_facets_should_count_groups(
+    session, client, user, token, assert_max_queries
+):
+    session.add_all([
+        CharacterFactory(
+            user_id=user.id, anime='Naruto', hierarchy='Hokage', age=31
+        ),
+        CharacterFactory(
+            user_id=user.id, anime='Naruto', hierarchy='Genin', age=12
+        ),
+        CharacterFactory(
+            user_id=user.id, anime='Bleach', hierarchy='Capitão', age=None
+        ),
+    ])
+    await session.commit()
+
+    with assert_max_queries(1):
+        response = client.get(
+            '/characters/facets',
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        'anime': [
+            {'value': 'Naruto', 'count': 2},
+            {'value': 'Bleach', 'count': 1},
+        ],
+        'hierarchy': [
+            {'value': 'Capitão', 'count': 1},
+            {'value': 'Genin', 'count': 1},
+            {'value': 'Hokage', 'count': 1},
+        ],
+        'age': [
+            {'value': '10-19', 'count': 1},
+            {'value': '30-39', 'count': 1},
+            {'value': None, 'count': 1},
+        ],
+    }
+
+
+@pytest.mark.asyncio
+async def test_character_facets_should_honor_list_filters(
+    session, client, user, token
+):
+    session.add_all([
+        CharacterFactory(user_id=user.id, anime='Naruto', hierarchy='Hokage'),
+        CharacterFactory(user_id=user.id, anime='Bleach', hierarchy='Capitão'),
+    ])
+    await session.commit()
+
+    response = client.get(
+        '/characters/facets?anime_contains=Naru',
         headers={'Authorization': f'Bearer {token}'},
     )
 
+    facets = response.json()
+    assert facets['anime'] == [{'value': 'Naruto', 'count': 1}]
+    assert facets['hierarchy'] == [{'value': 'Hokage', 'count': 1}]
+
+
+@pytest.mark.asyncio
+async def test_delete_character(
+    session, client, user, token, assert_max_queries
+):
+    character = CharacterFactory(user_id=user.id)
+    session.add(character)
+    await session.commit()
+    await session.refresh(character)
+
+    with assert_max_queries(1):
+        response = client.delete(
+            f'/characters/{character.id}',
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
     assert response.status_code == HTTPStatus.OK
     assert response.json() == {
         'message': 'Character has been deleted successfully.'
@@ -143,16 +370,543 @@ def test_patch_character_error(client, token):
     assert response.json() == {'detail': 'Character not found.'}
 
 
-def test_patch_character(session, client, user, token):
+@pytest.mark.asyncio
+async def test_patch_character(
+    session, client, user, token, assert_max_queries
+):
     character = CharacterFactory(user_id=user.id)
     session.add(character)
-    session.commit()
-    session.refresh(character)
+    await session.commit()
+    await session.refresh(character)
+
+    with assert_max_queries(1):
+        response = client.patch(
+            f'/characters/{character.id}',
+            json={'name': 'teste1'},
+            headers={'Authorization': f'Bearer {token}'},
+        )
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()['name'] == 'teste1'
+
+
+@pytest.mark.asyncio
+async def test_patch_character_should_return_400_name_exists(
+    session, client, user, token
+):
+    session.add_all([
+        CharacterFactory(user_id=user.id, name='Rem'),
+        CharacterFactory(user_id=user.id, name='Ram'),
+    ])
+    await session.commit()
 
     response = client.patch(
-        f'/characters/{character.id}',
-        json={'name': 'teste1'},
+        '/characters/2',
+        json={'name': 'Rem'},
         headers={'Authorization': f'Bearer {token}'},
     )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'detail': 'Character name already exists'}
+
+
+@pytest.mark.asyncio
+async def test_patch_character_should_reject_required_nulls(
+    session, client, user, token
+):
+    session.add(CharacterFactory(user_id=user.id, name='Rem'))
+    await session.commit()
+
+    response = client.patch(
+        '/characters/1',
+        json={'name': None},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.json()['detail'][0]['loc'] == ['body', 'name']
+
+
+@pytest.mark.asyncio
+async def test_patch_character_should_change_only_the_given_id(
+    session, client, user, token
+):
+    session.add_all([
+        CharacterFactory(user_id=user.id, name='Rem'),
+        CharacterFactory(user_id=user.id, name='Ram'),
+    ])
+    await session.commit()
+
+    response = client.patch(
+        '/characters/2',
+        json={'hierarchy': 'Oni'},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.json()['name'] == 'Ram'
+    characters = client.get(
+        '/characters/', headers={'Authorization': f'Bearer {token}'}
+    ).json()['characters']
+    assert [c['hierarchy'] == 'Oni' for c in characters] == [False, True]
+
+
+@pytest.mark.asyncio
+async def test_create_character_should_return_400_name_exists(
+    session, client, user, token
+):
+    session.add(CharacterFactory(user_id=user.id, name='Rem'))
+    await session.commit()
+
+    response = client.post(
+        '/characters/',
+        headers={'Authorization': f'Bearer {token}'},
+        json={
+            'name': 'Rem',
+            'anime': 'Re:Zero',
+            'hierarchy': 'Maid',
+            'abilities': 'Morning star',
+            'notable_moments': 'Arco 3',
+        },
+    )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'detail': 'Character name already exists'}
+
+
+@pytest.mark.asyncio
+async def test_patch_characters_in_batch(
+    session, client, user, token, assert_max_queries
+):
+    other_user = UserFactory()
+    session.add(other_user)
+    await session.commit()
+    session.add_all([
+        CharacterFactory(user_id=user.id, name='Rem', hierarchy='Maid'),
+        CharacterFactory(user_id=user.id, name='Ram', hierarchy='Maid'),
+        CharacterFactory(user_id=user.id, name='Emilia', hierarchy='Maid'),
+        CharacterFactory(user_id=other_user.id, name='Subaru', hierarchy='?'),
+    ])
+    await session.commit()
+
+    age = 17
+    # Mudanças diferentes em cada patch: ainda um UPDATE só
+    with assert_max_queries(1):
+        response = client.patch(
+            '/characters/batch',
+            json={
+                'characters': [
+                    {'id': 1, 'hierarchy': 'Oni'},
+                    {'id': 2, 'hierarchy': 'Demon', 'age': str(age)},
+                    {'id': 3, 'name': 'Emilia Tan'},
+                    {'id': 4, 'hierarchy': 'Oni'},
+                    {'id': 99, 'hierarchy': 'Oni'},
+                ]
+            },
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
     assert response.status_code == HTTPStatus.OK
-    assert response.json()['name'] == 'teste1'
+    assert response.json() == {
+        'results': [
+            {'id': 1, 'status': 'updated'},
+            {'id': 2, 'status': 'updated'},
+            {'id': 3, 'status': 'updated'},
+            {'id': 4, 'status': 'not_found'},
+            {'id': 99, 'status': 'not_found'},
+        ]
+    }
+
+    characters = client.get(
+        '/characters/', headers={'Authorization': f'Bearer {token}'}
+    ).json()['characters']
+    assert [(c['name'], c['hierarchy']) for c in characters] == [
+        ('Rem', 'Oni'),
+        ('Ram', 'Demon'),
+        ('Emilia Tan', 'Maid'),
+    ]
+    assert characters[1]['age'] == age
+
+
+@pytest.mark.asyncio
+async def test_patch_characters_in_batch_should_rollback_on_duplicate_name(
+    session, client, user, token
+):
+    session.add_all([
+        CharacterFactory(user_id=user.id, name='Rem', hierarchy='Maid'),
+        CharacterFactory(user_id=user.id, name='Ram', hierarchy='Maid'),
+    ])
+    await session.commit()
+
+    response = client.patch(
+        '/characters/batch',
+        json={
+            'characters': [
+                {'id': 1, 'hierarchy': 'Oni'},
+                {'id': 2, 'name': 'Rem'},
+            ]
+        },
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'detail': 'Character name already exists'}
+    characters = client.get(
+        '/characters/', headers={'Authorization': f'Bearer {token}'}
+    ).json()['characters']
+    assert {c['hierarchy'] for c in characters} == {'Maid'}
+
+
+@pytest.mark.asyncio
+async def test_patch_characters_in_batch_should_reject_required_nulls(
+    session, client, user, token
+):
+    session.add(CharacterFactory(user_id=user.id, name='Rem'))
+    await session.commit()
+
+    # name: null violaria o NOT NULL: recusado antes de chegar ao banco
+    response = client.patch(
+        '/characters/batch',
+        json={'characters': [{'id': 1, 'name': None}, {'id': 1, 'age': None}]},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert [error['loc'] for error in response.json()['detail']] == [
+        ['body', 'characters', 0, 'name']
+    ]
+
+
+def test_patch_characters_in_batch_should_reject_empty_patch(client, token):
+    response = client.patch(
+        '/characters/batch',
+        json={'characters': [{'id': 1}]},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_delete_characters_in_batch(
+    session, client, user, token, assert_max_queries
+):
+    other_user = UserFactory()
+    session.add(other_user)
+    await session.commit()
+    session.add_all([
+        CharacterFactory(user_id=user.id),
+        CharacterFactory(user_id=user.id),
+        CharacterFactory(user_id=user.id),
+        CharacterFactory(user_id=other_user.id),
+    ])
+    await session.commit()
+
+    with assert_max_queries(1):
+        response = client.post(
+            '/characters/batch/delete',
+            json={'ids': [1, 3, 4, 3]},
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        'results': [
+            {'id': 1, 'status': 'deleted'},
+            {'id': 3, 'status': 'deleted'},
+            {'id': 4, 'status': 'not_found'},
+        ]
+    }
+    characters = client.get(
+        '/characters/', headers={'Authorization': f'Bearer {token}'}
+    ).json()['characters']
+    assert [c['id'] for c in characters] == [2]
+
+
+@pytest.mark.asyncio
+async def test_search_characters_should_rank_name_matches_first(
+    session, client, user, token
+):
+    session.add_all([
+        CharacterFactory(
+            user_id=user.id,
+            name='Kakashi Hatake',
+            notable_moments='Treinou Naruto e Sasuke no time 7',
+        ),
+        CharacterFactory(user_id=user.id, name='Naruto Uzumaki'),
+        CharacterFactory(user_id=user.id, name='Ichigo Kurosaki'),
+    ])
+    await session.commit()
+
+    response = client.get(
+        '/characters/search?q=naruto',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+    characters = response.json()['characters']
+
+    assert response.status_code == HTTPStatus.OK
+    assert [c['name'] for c in characters] == [
+        'Naruto Uzumaki',
+        'Kakashi Hatake',
+    ]
+    assert characters[0]['rank'] > characters[1]['rank']
+    assert '<mark>Naruto</mark>' in characters[1]['headline']
+
+
+@pytest.mark.asyncio
+async def test_search_characters_should_ignore_other_users(
+    session, client, user, user_fun, token
+):
+    session.add(CharacterFactory(user_id=user_fun.id, name='Satoru Gojo'))
+    await session.commit()
+
+    response = client.get(
+        '/characters/search?q=gojo',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {'characters': []}
+
+
+@pytest.mark.asyncio
+async def test_search_characters_fuzzy_should_tolerate_typos(
+    session, client, user, token
+):
+    session.add_all([
+        CharacterFactory(user_id=user.id, name='Satoru Gojo', anime='Jujutsu'),
+        CharacterFactory(user_id=user.id, name='Naruto', anime='Naruto'),
+    ])
+    await session.commit()
+
+    response = client.get(
+        '/characters/search?q=Narutto&fuzzy=true',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+    characters = response.json()['characters']
+
+    assert response.status_code == HTTPStatus.OK
+    assert [c['name'] for c in characters] == ['Naruto']
+    assert characters[0]['headline'] is None
+
+
+@pytest.mark.asyncio
+async def test_search_characters_fuzzy_should_respect_threshold(
+    session, client, user, token
+):
+    session.add(CharacterFactory(user_id=user.id, name='Satoru Gojo'))
+    await session.commit()
+
+    response = client.get(
+        '/characters/search?q=Gojo Satoro&fuzzy=true&threshold=0.95',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {'characters': []}
+
+
+def test_list_characters_should_answer_304_for_known_etag(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    response = client.get('/characters/', headers=headers)
+    etag = response.headers['ETag']
+
+    response = client.get(
+        '/characters/', headers={**headers, 'If-None-Match': etag}
+    )
+
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.headers['ETag'] == etag
+    assert not response.content
+
+
+def test_list_characters_cache_should_be_invalidated_by_writes(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    first = client.get('/characters/', headers=headers)
+    client.post(
+        '/characters/',
+        headers=headers,
+        json={
+            'name': 'Rukia Kuchiki',
+            'anime': 'Bleach',
+            'hierarchy': 'Tenente',
+            'abilities': 'Sode no Shirayuki',
+            'notable_moments': 'Transferiu seus poderes para Ichigo',
+        },
+    )
+
+    response = client.get(
+        '/characters/',
+        headers={**headers, 'If-None-Match': first.headers['ETag']},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert [c['name'] for c in response.json()['characters']] == [
+        'Rukia Kuchiki'
+    ]
+
+
+def test_import_characters_ndjson_should_report_bad_rows(
+    client, token, monkeypatch
+):
+    monkeypatch.setattr('senpaisearch.bulk_import.IMPORT_CHUNK_SIZE', 2)
+    character = {
+        'anime': 'Naruto',
+        'hierarchy': 'Hokage',
+        'abilities': 'Rasengan',
+        'notable_moments': 'Virou Hokage',
+    }
+    lines = [
+        json.dumps({**character, 'name': 'Naruto Uzumaki'}),
+        json.dumps({**character, 'name': 'Minato Namikaze', 'age': 24}),
+        '{not json',
+        json.dumps({**character, 'name': 'Naruto Uzumaki'}),
+        '',
+        json.dumps({'name': 'Sem anime'}),
+        json.dumps({**character, 'name': 'Tsunade'}),
+    ]
+
+    response = client.post(
+        '/characters/import',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/x-ndjson',
+        },
+        content='\n'.join(lines),
+    )
+    report = response.json()
+    expected_imported = expected_failed = 3
+
+    assert response.status_code == HTTPStatus.OK
+    assert report['imported'] == expected_imported
+    assert report['failed'] == expected_failed
+    assert [error['line'] for error in report['errors']] == [3, 4, 6]
+    assert report['errors'][1]['detail'] == 'Character name already exists'
+
+
+def test_import_characters_csv_should_accept_multiline_fields(client, token):
+    body = (
+        'name,age,anime,hierarchy,abilities,notable_moments\n'
+        'Ichigo Kurosaki,,Bleach,Substituto,Bankai,"Salvou a Rukia,\n'
+        'derrotou o Aizen"\n'
+        'Orihime Inoue,15,Bleach,Humana,Shun Shun Rikka,Protegeu o Ichigo\n'
+    )
+
+    response = client.post(
+        '/characters/import',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'text/csv; charset=utf-8',
+        },
+        content=body,
+    )
+    characters = client.get(
+        '/characters/', headers={'Authorization': f'Bearer {token}'}
+    ).json()['characters']
+
+    assert response.json() == {'imported': 2, 'failed': 0, 'errors': []}
+    assert characters[0]['age'] is None
+    assert characters[0]['notable_moments'] == (
+        'Salvou a Rukia,\nderrotou o Aizen'
+    )
+
+
+@pytest.mark.asyncio
+async def test_iter_lines_should_skip_lines_over_the_limit(monkeypatch):
+    monkeypatch.setattr('senpaisearch.bulk_import.MAX_LINE_SIZE', 5)
+
+    async def chunks():
+        for chunk in (
+            b'abc\r\n1234',
+            b'567890',
+            b'12\nxy',
+            b'z\n',
+            b'toolong',
+        ):
+            yield chunk
+
+    lines = [line async for line in iter_lines(chunks())]
+
+    # A linha longa vira None uma vez só, mesmo chegando em vários pedaços
+    assert lines == ['abc', None, 'xyz', None]
+
+
+def test_import_characters_should_report_lines_over_the_limit(
+    client, token, monkeypatch
+):
+    monkeypatch.setattr('senpaisearch.bulk_import.MAX_LINE_SIZE', 200)
+    character = {
+        'name': 'Rock Lee',
+        'anime': 'Naruto',
+        'hierarchy': 'Genin',
+        'abilities': 'Taijutsu',
+        'notable_moments': 'Abriu os portões',
+    }
+
+    response = client.post(
+        '/characters/import',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/x-ndjson',
+        },
+        content='\n'.join([
+            json.dumps({**character, 'notable_moments': 'x' * 300}),
+            json.dumps(character),
+        ]),
+    )
+
+    assert response.json() == {
+        'imported': 1,
+        'failed': 1,
+        'errors': [{'line': 1, 'detail': 'Line too long'}],
+    }
+
+
+def test_import_characters_unsupported_format(client, token):
+    response = client.post(
+        '/characters/import',
+        headers={'Authorization': f'Bearer {token}'},
+        json=[],
+    )
+
+    assert response.status_code == HTTPStatus.UNSUPPORTED_MEDIA_TYPE
+
+
+@pytest.mark.asyncio
+async def test_export_characters_ndjson(session, client, user, token):
+    session.add_all(CharacterFactory.create_batch(3, user_id=user.id))
+    await session.commit()
+
+    response = client.get(
+        '/characters/export', headers={'Authorization': f'Bearer {token}'}
+    )
+    rows = [json.loads(line) for line in response.text.splitlines()]
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert [row['id'] for row in rows] == [1, 2, 3]
+    assert set(rows[0]) == {
+        'id',
+        'name',
+        'age',
+        'anime',
+        'hierarchy',
+        'abilities',
+        'notable_moments',
+    }
+
+
+@pytest.mark.asyncio
+async def test_export_characters_csv(session, client, user, token):
+    session.add(
+        CharacterFactory(user_id=user.id, name='Hinata', abilities='Byakugan')
+    )
+    await session.commit()
+
+    response = client.get(
+        '/characters/export?format=csv',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+    [row] = csv.DictReader(io.StringIO(response.text))
+
+    assert response.headers['content-type'].startswith('text/csv')
+    assert row['name'] == 'Hinata'
+    assert row['abilities'] == 'Byakugan'
@@ -1,14 +1,328 @@
-from sqlalchemy import select
+import asyncio
 
-from senpaisearch.models import User
+import pytest
+from sqlalchemy import func, insert, select, text, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
 
+from senpaisearch import database
+from senpaisearch.cache import MemoryBackend
+from senpaisearch.database import (
+    PrimarySession,
+    RecentWriters,
+    ReplicaSet,
+    RoutingSession,
+    engine_options,
+    read_connection,
+    set_request_user,
+    track_queries,
+)
+from senpaisearch.models import Character, User
+from senpaisearch.pagination import encode_cursor, page_queries
+from senpaisearch.query_builder import filter_characters, sort_keys
+from senpaisearch.schemas import CharacterFilter
+from senpaisearch.settings import Settings, get_settings
 
-def test_create_user(session):
+
+@pytest.mark.asyncio
+async def test_create_user(session):
     user = User(username='bogea', email='bogea@gmail.com', password='bogea123')
     session.add(user)
-    session.commit()
-    result = session.scalar(
+    await session.commit()
+    result = await session.scalar(
         select(User).where(User.email == 'bogea@gmail.com')
     )
 
     assert result.username == 'bogea'
+
+
+def test_engine_options_pool_settings():
+    pool_size = 50
+    settings = Settings(DB_POOL_SIZE=pool_size, DB_STATEMENT_TIMEOUT_MS=5000)
+
+    options = engine_options(settings)
+
+    assert options['pool_size'] == pool_size
+    assert options['connect_args'] == {'options': '-c statement_timeout=5000'}
+
+
+def test_engine_options_external_pooler():
+    settings = Settings(DB_EXTERNAL_POOLER=True, DB_STATEMENT_TIMEOUT_MS=5000)
+
+    options = engine_options(settings)
+
+    assert options['poolclass'] is NullPool
+    assert options['connect_args'] == {'prepare_threshold': None}
+
+
+@pytest.mark.asyncio
+async def test_track_queries_should_log_slow_queries_with_plan(engine, caplog):
+    slow_engine = create_async_engine(engine.url, poolclass=NullPool)
+    track_queries(slow_engine.sync_engine, slow_query_ms=10)
+
+    async with slow_engine.begin() as conn:
+        await conn.execute(select(func.pg_sleep(0.05)))
+        # O EXPLAIN não pode ter derrubado a transação
+        assert await conn.scalar(select(1)) == 1
+
+    await slow_engine.dispose()
+
+    assert 'Slow query' in caplog.text
+    assert 'pg_sleep' in caplog.text
+    assert 'Result  (cost=' in caplog.text
+
+
+def test_replica_set_should_rotate_between_idle_replicas():
+    replica_set = ReplicaSet(
+        [
+            create_async_engine(f'postgresql+psycopg://app@replica{n}/db')
+            for n in (1, 2)
+        ],
+        retry_after=60,
+    )
+
+    chosen = [replica_set.choose().url.host for _ in range(4)]
+    assert chosen == ['replica1', 'replica2', 'replica1', 'replica2']
+
+    for replica in replica_set.engines:
+        replica_set.mark_down(replica)
+    assert replica_set.choose() is None
+
+
+@pytest.mark.asyncio
+async def test_replica_set_check_should_take_down_unreachable_replicas(
+    engine,
+):
+    healthy = create_async_engine(engine.url, poolclass=NullPool)
+    # Nada escuta na porta 1: a conexão é recusada na hora
+    unreachable = create_async_engine(
+        'postgresql+psycopg://app@127.0.0.1:1/db', poolclass=NullPool
+    )
+    replica_set = ReplicaSet([unreachable, healthy], retry_after=60)
+
+    statuses = await replica_set.check()
+    await healthy.dispose()
+
+    assert [status['status'] for status in statuses] == ['unavailable', 'ok']
+    assert replica_set.available() == [healthy]
+
+
+def test_routing_session_should_keep_writes_on_primary(engine, monkeypatch):
+    replica = create_async_engine('postgresql+psycopg://app@replica/db')
+    replica_set = ReplicaSet([replica], retry_after=60)
+    monkeypatch.setattr(database, 'get_replicas', lambda: replica_set)
+    session = RoutingSession(bind=engine.sync_engine)
+
+    assert session.get_bind(clause=select(User)) is replica.sync_engine
+    write = update(User).values(username='bogea')
+    assert session.get_bind(clause=write) is engine.sync_engine
+    # Depois de uma escrita a sessão não volta para a réplica
+    assert session.get_bind(clause=select(User)) is engine.sync_engine
+
+
+@pytest.mark.asyncio
+async def test_routing_session_should_fall_back_to_primary(
+    session, engine, monkeypatch
+):
+    unreachable = create_async_engine(
+        'postgresql+psycopg://app@127.0.0.1:1/db', poolclass=NullPool
+    )
+    replica_set = ReplicaSet([unreachable], retry_after=60)
+    monkeypatch.setattr(database, 'get_replicas', lambda: replica_set)
+
+    async with AsyncSession(
+        engine, sync_session_class=RoutingSession
+    ) as routing:
+        count = await routing.scalar(select(func.count()).select_from(User))
+
+    assert count == 0
+    assert replica_set.available() == []
+
+
+@pytest.mark.asyncio
+async def test_read_connection_should_use_the_chosen_replica(
+    session, engine, monkeypatch
+):
+    replica = create_async_engine(engine.url, poolclass=NullPool)
+    replica_set = ReplicaSet([replica], retry_after=60)
+    monkeypatch.setattr(database, 'get_replicas', lambda: replica_set)
+
+    async with AsyncSession(
+        engine, sync_session_class=RoutingSession
+    ) as routing:
+        async with read_connection(routing, select(User)) as conn:
+            assert conn.engine is replica
+            await conn.execute(select(User))
+
+    await replica.dispose()
+
+
+@pytest.mark.asyncio
+async def test_read_connection_should_fall_back_to_primary(
+    session, engine, monkeypatch
+):
+    unreachable = create_async_engine(
+        'postgresql+psycopg://app@127.0.0.1:1/db', poolclass=NullPool
+    )
+    replica_set = ReplicaSet([unreachable], retry_after=60)
+    monkeypatch.setattr(database, 'get_replicas', lambda: replica_set)
+
+    async with AsyncSession(
+        engine, sync_session_class=RoutingSession
+    ) as routing:
+        async with read_connection(routing, select(User)) as conn:
+            assert conn.engine is engine
+            await conn.execute(select(User))
+
+    assert replica_set.available() == []
+
+
+@pytest.mark.asyncio
+async def test_routing_session_should_read_recent_writers_from_primary(
+    engine, monkeypatch
+):
+    replica = create_async_engine('postgresql+psycopg://app@replica/db')
+    replica_set = ReplicaSet([replica], retry_after=60)
+    # Dois workers com o mesmo backend, como com o Redis do CACHE_URL
+    backend = MemoryBackend(maxsize=10, ttl=60)
+    writing_worker = RecentWriters(backend, ttl=5)
+    reading_worker = RecentWriters(backend, ttl=5)
+    monkeypatch.setattr(database, 'get_replicas', lambda: replica_set)
+    monkeypatch.setattr(database, 'get_recent_writers', lambda: reading_worker)
+    monkeypatch.setattr(get_settings(), 'DATABASE_REPLICA_URLS', ['replica'])
+
+    async def read_bind(user_id):
+        # Cada requisição roda no próprio contexto, como no servidor
+        await set_request_user(user_id)
+        return RoutingSession(bind=engine.sync_engine).get_bind(
+            clause=select(User)
+        )
+
+    await writing_worker.remember(1)
+
+    assert await asyncio.create_task(read_bind(1)) is engine.sync_engine
+    assert await asyncio.create_task(read_bind(2)) is replica.sync_engine
+
+
+@pytest.mark.asyncio
+async def test_primary_session_should_remember_the_writer(
+    session, engine, monkeypatch
+):
+    writers = RecentWriters(MemoryBackend(maxsize=10, ttl=60), ttl=5)
+    monkeypatch.setattr(database, 'get_recent_writers', lambda: writers)
+    monkeypatch.setattr(get_settings(), 'DATABASE_REPLICA_URLS', ['replica'])
+
+    async def request(statement):
+        await set_request_user(1)
+        async with PrimarySession(engine) as primary:
+            await primary.execute(statement)
+            await primary.commit()
+
+    await asyncio.create_task(request(select(User)))
+    assert not await writers.contains(1)
+
+    await asyncio.create_task(
+        request(
+            insert(User).values(
+                username='bogea', email='bogea@gmail.com', password='x'
+            )
+        )
+    )
+    assert await writers.contains(1)
+
+
+def _list_query(**params):
+    # A mesma consulta da listagem de personagens, para o usuário 1
+    character_filter = CharacterFilter(**params)
+    keys, descending = sort_keys(character_filter.sort)
+    return page_queries(
+        filter_characters(select(Character), 1, character_filter),
+        keys,
+        character_filter,
+        descending,
+    )
+
+
+# Consultas das rotas mais usadas e o índice que cada uma deve usar. As
+# listagens podem ser mais de uma consulta (veja page_queries).
+HOT_QUERIES = {
+    'list': ('ix_characters_user_id_id', _list_query(after=encode_cursor(1))),
+    'anime': ('ix_characters_user_id_anime', _list_query(anime=['Naruto'])),
+    'hierarchy': (
+        'ix_characters_user_id_hierarchy',
+        _list_query(hierarchy=['Hokage']),
+    ),
+    'name': (
+        'ix_characters_user_id_name',
+        _list_query(sort='name', after=encode_cursor('Naruto')),
+    ),
+    'age': (
+        'ix_characters_user_id_age_id',
+        _list_query(sort='age', after=encode_cursor(30, 10)),
+    ),
+    'age_nulls': (
+        'ix_characters_user_id_age_id',
+        _list_query(sort='age', after=encode_cursor(None, 10)),
+    ),
+    '-age': (
+        'ix_characters_user_id_age_id',
+        _list_query(sort='-age', after=encode_cursor(30, 10)),
+    ),
+    '-age_nulls': (
+        'ix_characters_user_id_age_id',
+        _list_query(sort='-age', after=encode_cursor(None, 10)),
+    ),
+    'login': (
+        'users_email_key',
+        [select(User).where(User.email == 'test@test.com')],
+    ),
+}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('name', HOT_QUERIES)
+async def test_hot_queries_should_use_index_scans(session, name):
+    index_name, statements = HOT_QUERIES[name]
+    # Com as tabelas de teste quase vazias o planejador prefere seq scan (ou
+    # um bitmap de qualquer índice do usuário); desligá-los mostra se existe
+    # um índice capaz de atender a consulta
+    for setting in ('enable_seqscan', 'enable_bitmapscan'):
+        await session.execute(text(f'SET LOCAL {setting} = off'))
+    for statement in statements:
+        sql = statement.compile(
+            dialect=postgresql.dialect(),
+            compile_kwargs={'literal_binds': True},
+        )
+        plan = '\n'.join(await session.scalars(text(f'EXPLAIN {sql}')))
+
+        assert 'Seq Scan' not in plan
+        assert index_name in plan
+
+
+# Páginas por keyset que devem ler um só trecho do índice, já na ordem
+ORDERED_PAGES = ['list', 'name', 'age', 'age_nulls', '-age', '-age_nulls']
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('name', ORDERED_PAGES)
+async def test_keyset_pages_should_read_the_index_in_order(session, name):
+    index_name, statements = HOT_QUERIES[name]
+    # Sem seq scan, bitmap e Sort, o planejador só os usa se nenhum índice
+    # entregar as linhas na ordem pedida. Um OR na condição do cursor, por
+    # exemplo, obrigaria um bitmap seguido de Sort ou um Filter sobre o
+    # índice inteiro do usuário
+    for setting in ('enable_seqscan', 'enable_bitmapscan', 'enable_sort'):
+        await session.execute(text(f'SET LOCAL {setting} = off'))
+    for statement in statements:
+        sql = statement.compile(
+            dialect=postgresql.dialect(),
+            compile_kwargs={'literal_binds': True},
+        )
+        plan = '\n'.join(await session.scalars(text(f'EXPLAIN {sql}')))
+
+        assert index_name in plan
+        assert 'Bitmap' not in plan
+        assert 'Sort' not in plan
+        # Todo o cursor vira Index Cond; nada lido e descartado depois
+        assert 'Filter' not in plan
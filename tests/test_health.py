@@ -0,0 +1,26 @@
+from http import HTTPStatus
+
+from sqlalchemy.exc import OperationalError
+
+
+def test_database_health(client):
+    response = client.get('/health/db')
+    data = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert data['status'] == 'ok'
+    assert data['pool']['pool_class'] == 'AsyncAdaptedQueuePool'
+    assert data['pool']['checked_out'] >= 0
+    assert data['replicas'] == []
+
+
+def test_database_health_unavailable(client, session, monkeypatch):
+    async def fail(*args, **kwargs):
+        raise OperationalError('SELECT 1', {}, Exception('connection lost'))
+
+    monkeypatch.setattr(session, 'execute', fail)
+
+    response = client.get('/health/db')
+
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response.json() == {'detail': 'Database unavailable'}
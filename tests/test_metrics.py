@@ -0,0 +1,47 @@
+import re
+from http import HTTPStatus
+
+from senpaisearch.database import QueryStats
+from senpaisearch.metrics import server_timing
+
+
+def test_metrics_should_count_requests_by_route(client):
+    client.get('/')
+    client.get('/rota-que-nao-existe')
+
+    response = client.get('/metrics')
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['content-type'].startswith('text/plain')
+    assert (
+        'http_requests_total{method="GET",route="/",status="200"}'
+        in response.text
+    )
+    assert 'route="<unmatched>",status="404"' in response.text
+    assert 'http_request_duration_seconds_bucket' in response.text
+    assert 'db_pool_checked_out' in response.text
+
+
+def test_metrics_should_observe_password_hashing(client, user):
+    response = client.get('/metrics')
+
+    assert 'password_hash_duration_seconds_count{operation="hash"}' in (
+        response.text
+    )
+
+
+def test_server_timing_should_report_queries_of_the_request(client):
+    response = client.get('/health/db')
+
+    timing = response.headers['server-timing']
+    assert re.fullmatch(
+        r'db;dur=\d+\.\d;desc="1 queries", app;dur=\d+\.\d', timing
+    )
+
+
+def test_server_timing_format():
+    stats = QueryStats(count=3, duration=0.0125)
+
+    assert server_timing(stats, 0.05) == (
+        'db;dur=12.5;desc="3 queries", app;dur=50.0'
+    )
@@ -1,13 +1,21 @@
 from http import HTTPStatus
 
+import pytest
 from jwt import decode
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from senpaisearch.security import create_access_token, settings
+from senpaisearch.security import (
+    create_access_token,
+    get_current_user,
+    get_principal_cache,
+)
+from senpaisearch.settings import get_settings
 
 
 def test_jwt():
     data = {'sub': 'test@test.com'}
     token = create_access_token(data)
+    settings = get_settings()
 
     result = decode(
         token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -24,3 +32,43 @@ def test_jwt_invalid_token(client):
 
     assert response.status_code == HTTPStatus.UNAUTHORIZED
     assert response.json() == {'detail': 'Could not validate credentials'}
+
+
+def test_jwt_without_user_id_should_be_rejected(client):
+    token = create_access_token({'sub': 'test@test.com'})
+
+    response = client.get(
+        '/characters/', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    assert response.json() == {'detail': 'Could not validate credentials'}
+
+
+def test_jwt_with_old_token_version_should_be_rejected(client, user, token):
+    stale_token = create_access_token({
+        'sub': user.email,
+        'uid': user.id,
+        'ver': user.token_version - 1,
+    })
+
+    response = client.get(
+        '/characters/', headers={'Authorization': f'Bearer {stale_token}'}
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_should_release_the_connection(
+    engine, user, token
+):
+    get_principal_cache().clear()
+
+    async with AsyncSession(engine) as session:
+        principal = await get_current_user(session, token)
+
+        # A consulta do usuário não segura a conexão até o fim da requisição
+        assert not session.in_transaction()
+
+    assert principal.id == user.id
@@ -0,0 +1,86 @@
+import pytest
+
+from senpaisearch.server import (
+    METRICS_DIR_VARIABLE,
+    Worker,
+    check_settings,
+    cpu_count,
+    prepare_metrics_dir,
+    server_options,
+)
+from senpaisearch.settings import Settings
+
+# Tempo ocioso padrão comum nos balanceadores (ALB, upstream do nginx)
+LB_IDLE_TIMEOUT_SECONDS = 60
+
+
+def test_server_options_should_default_to_one_worker_per_cpu():
+    options = server_options(Settings(SERVER_WORKERS=0))
+
+    assert options['workers'] == cpu_count()
+    assert options['worker_class'] is Worker
+    assert options['preload_app'] is True
+
+
+def test_server_options_should_use_configured_process_model():
+    workers = 3
+    settings = Settings(
+        SERVER_WORKERS=workers,
+        SERVER_MAX_REQUESTS=500,
+        SERVER_GRACEFUL_TIMEOUT_SECONDS=10,
+        SERVER_TIMEOUT_SECONDS=120,
+    )
+
+    options = server_options(settings)
+
+    assert options['workers'] == workers
+    assert options['max_requests'] == settings.SERVER_MAX_REQUESTS
+    assert options['graceful_timeout'] == (
+        settings.SERVER_GRACEFUL_TIMEOUT_SECONDS
+    )
+    assert options['timeout'] == settings.SERVER_TIMEOUT_SECONDS
+
+
+def test_server_options_should_keep_connections_past_the_lb_idle_timeout():
+    settings = Settings()
+
+    options = server_options(settings)
+
+    assert options['keepalive'] > LB_IDLE_TIMEOUT_SECONDS
+
+
+def test_check_settings_should_disable_local_cache_for_many_workers():
+    settings = Settings()
+
+    check_settings(settings, workers=1)
+    assert settings.CACHE_ENABLED
+
+    check_settings(settings, workers=2)
+    assert not settings.CACHE_ENABLED
+
+    shared = Settings(CACHE_URL='redis://cache')
+    check_settings(shared, workers=2)
+    assert shared.CACHE_ENABLED
+
+
+def test_check_settings_should_require_shared_markers_for_replicas():
+    settings = Settings(DATABASE_REPLICA_URLS=['postgresql://replica/db'])
+
+    check_settings(settings, workers=1)
+    with pytest.raises(SystemExit, match='CACHE_URL'):
+        check_settings(settings, workers=2)
+
+    settings.CACHE_URL = 'redis://cache'
+    check_settings(settings, workers=2)
+
+
+def test_prepare_metrics_dir_should_remove_stale_metrics(
+    tmp_path, monkeypatch
+):
+    stale = tmp_path / 'counter_123.db'
+    stale.write_bytes(b'')
+    monkeypatch.setenv(METRICS_DIR_VARIABLE, str(tmp_path))
+
+    prepare_metrics_dir()
+
+    assert not stale.exists()
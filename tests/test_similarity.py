@@ -0,0 +1,228 @@
+import asyncio
+import time
+from datetime import datetime
+from http import HTTPStatus
+from zoneinfo import ZoneInfo
+
+import pytest
+from sqlalchemy import delete, update
+
+from senpaisearch.models import Character
+from senpaisearch.settings import get_settings
+from senpaisearch.similarity import SimilarityIndex, similarity_index
+from tests.conftest import CharacterFactory
+
+ABILITIES = {
+    'Naruto': 'Rasengan e clones das sombras',
+    'Boruto': 'Rasengan invisível e clones das sombras',
+    'Ichigo': 'Bankai com a espada Zangetsu',
+}
+
+
+@pytest.mark.asyncio
+async def test_similarity_index_should_rank_by_shared_terms():
+    index = SimilarityIndex()
+    index.build([
+        (1, 1, 'Rasengan e clones das sombras'),
+        (2, 1, 'Rasengan invisível e clones das sombras'),
+        (3, 1, 'Rasengan gigante'),
+        (4, 1, 'Bankai com a espada Zangetsu'),
+        (5, 2, 'Rasengan e clones das sombras'),
+    ])
+
+    (first, _), (second, _) = (await index.similar([1], user_id=1, k=10))[1]
+
+    # 4 não divide termos e 5 é de outro usuário
+    assert [first, second] == [2, 3]
+    assert await index.similar([1, 5], user_id=2, k=10) == {5: []}
+
+
+@pytest.mark.asyncio
+async def test_similarity_index_should_score_only_the_owners_rows():
+    index = SimilarityIndex()
+    # Usuários intercalados nos ids: a matriz fica agrupada por dono
+    index.build([
+        (1, 2, 'Rasengan e clones'),
+        (2, 1, 'Rasengan e clones'),
+        (3, 2, 'Rasengan'),
+        (4, 1, 'Rasengan'),
+        (5, 3, 'Rasengan e clones'),
+    ])
+    index.save(2, 6, 'clones')
+    index.remove(2, 3)
+
+    assert list(index.user_ids) == [1, 1, 2, 2, 3]
+    assert [id_ for id_, _ in (await index.similar([2], 1, k=10))[2]] == [4]
+    assert [id_ for id_, _ in (await index.similar([1], 2, k=10))[1]] == [6]
+    assert await index.similar([2], 2, k=10) == {}
+
+    await index.compact()
+
+    assert list(index.ids) == [2, 4, 1, 6, 5]
+    assert [id_ for id_, _ in (await index.similar([1], 2, k=10))[1]] == [6]
+
+
+@pytest.mark.asyncio
+async def test_similarity_index_should_apply_writes_and_survive_snapshot(
+    tmp_path,
+):
+    index = SimilarityIndex()
+    index.build([(1, 1, 'Rasengan'), (2, 1, 'Bankai')])
+
+    index.save(1, 2, 'Bankai e Rasengan')
+    index.save(1, 3, 'Rasengan')
+    index.remove(1, 3)
+    assert [id_ for id_, _ in (await index.similar([1], 1, k=10))[1]] == [2]
+
+    index.updated_since = datetime(2026, 10, 18, tzinfo=ZoneInfo('UTC'))
+    index.save_snapshot(tmp_path)
+    loaded = SimilarityIndex()
+    loaded.load(tmp_path)
+
+    assert await loaded.similar([1], 1, k=10) == await index.similar(
+        [1], 1, k=10
+    )
+    assert loaded.updated_since == index.updated_since
+
+
+@pytest.mark.asyncio
+async def test_similarity_index_should_load_once_for_concurrent_requests(
+    monkeypatch,
+):
+    index = SimilarityIndex()
+    loads = []
+
+    async def load_from_database(session):
+        loads.append(session)
+        await asyncio.sleep(0)
+        index.build([(1, 1, 'Rasengan')])
+
+    async def catch_up(session):
+        index.refreshed_at = time.monotonic()
+
+    monkeypatch.setattr(index, 'load_from_database', load_from_database)
+    monkeypatch.setattr(index, '_catch_up', catch_up)
+    await asyncio.gather(*(index.ensure_loaded(None) for _ in range(3)))
+
+    assert len(loads) == 1
+
+
+@pytest.mark.asyncio
+async def test_similarity_index_should_keep_writes_made_while_compacting():
+    index = SimilarityIndex()
+    index.build([(1, 1, 'Rasengan'), (2, 1, 'Rasengan'), (3, 1, 'Bankai')])
+    index.save(1, 4, 'Rasengan')
+
+    compaction = asyncio.create_task(index.compact())
+    await asyncio.sleep(0)
+    # A thread já copiou as escritas pendentes; estas chegam depois
+    index.remove(1, 4)
+    index.save(1, 3, 'Rasengan')
+    await compaction
+
+    # 4 já foi incorporado pela compactação e 3 tem uma versão nova
+    assert index.removed == {3, 4}
+    assert list(index.recent) == [3]
+    assert [id_ for id_, _ in (await index.similar([1], 1, k=10))[1]] == [
+        2,
+        3,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_similar_characters_should_return_closest_first(
+    session, client, user, token
+):
+    session.add_all([
+        CharacterFactory(user_id=user.id, name=name, abilities=abilities)
+        for name, abilities in ABILITIES.items()
+    ])
+    await session.commit()
+
+    response = client.get(
+        '/characters/1/similar',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    names = [character['name'] for character in response.json()['characters']]
+    assert names[0] == 'Boruto'
+    assert 'Naruto' not in names
+
+
+@pytest.mark.asyncio
+async def test_similar_characters_should_follow_character_writes(
+    session, client, user, token, assert_max_queries
+):
+    session.add(
+        CharacterFactory(user_id=user.id, name='Naruto', abilities='Rasengan')
+    )
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+    client.get('/characters/1/similar', headers=headers)
+
+    client.post(
+        '/characters/',
+        headers=headers,
+        json={
+            'name': 'Minato',
+            'anime': 'Naruto',
+            'hierarchy': 'Hokage',
+            'abilities': 'Rasengan',
+            'notable_moments': 'Selou a Kyuubi',
+        },
+    )
+    # Com o índice carregado, só os dados dos vizinhos vêm do banco
+    with assert_max_queries(1):
+        response = client.get('/characters/1/similar', headers=headers)
+    assert [c['name'] for c in response.json()['characters']] == ['Minato']
+
+    client.delete('/characters/2', headers=headers)
+    response = client.get('/characters/1/similar', headers=headers)
+    assert response.json() == {'characters': []}
+
+
+@pytest.mark.asyncio
+async def test_similar_characters_should_see_writes_from_other_workers(
+    session, client, user, token, monkeypatch
+):
+    naruto, boruto, ichigo = [
+        CharacterFactory(user_id=user.id, name=name, abilities=abilities)
+        for name, abilities in ABILITIES.items()
+    ]
+    session.add_all([naruto, boruto, ichigo])
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+    client.get(f'/characters/{naruto.id}/similar', headers=headers)
+
+    # Escritas direto no banco, como as de outro worker
+    await session.execute(
+        update(Character)
+        .where(Character.id == ichigo.id)
+        .values(abilities=naruto.abilities, notable_moments='')
+    )
+    await session.execute(delete(Character).where(Character.id == boruto.id))
+    await session.commit()
+    monkeypatch.setattr(get_settings(), 'SIMILARITY_REFRESH_SECONDS', 0)
+
+    response = client.get(f'/characters/{naruto.id}/similar', headers=headers)
+
+    assert [c['name'] for c in response.json()['characters']] == ['Ichigo']
+    # O apagado não volta a ser candidato
+    assert boruto.id in similarity_index.removed
+
+
+@pytest.mark.asyncio
+async def test_similar_characters_should_hide_other_users_characters(
+    session, client, user_fun, token
+):
+    session.add(CharacterFactory(user_id=user_fun.id))
+    await session.commit()
+
+    response = client.get(
+        '/characters/1/similar',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    assert response.json() == {'detail': 'Character not found'}
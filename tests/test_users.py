@@ -3,15 +3,16 @@ from http import HTTPStatus
 from senpaisearch.schemas import UserPublic
 
 
-def test_create_user(client):
-    response = client.post(
-        '/users/',
-        json={
-            'username': 'bogea',
-            'password': 'bogea123',
-            'email': 'bogea@gmail.com',
-        },
-    )
+def test_create_user(client, assert_max_queries):
+    with assert_max_queries(1):
+        response = client.post(
+            '/users/',
+            json={
+                'username': 'bogea',
+                'password': 'bogea123',
+                'email': 'bogea@gmail.com',
+            },
+        )
     # Voltou o status code correto?
     assert response.status_code == HTTPStatus.CREATED
     # Valiidação do UserPublic
@@ -25,28 +26,57 @@ def test_create_user(client):
 def test_read_users(client):
     response = client.get('/users')
     assert response.status_code == HTTPStatus.OK
-    assert response.json() == {'users': []}
+    assert response.json() == {'users': [], 'next_cursor': None}
 
 
-def test_read_users_with_user(client, user):
+def test_read_users_with_user(client, user, assert_max_queries):
     user_schema = UserPublic.model_validate(user).model_dump()
-    response = client.get('/users/')
+    with assert_max_queries(1):
+        response = client.get('/users/')
 
     assert response.status_code == HTTPStatus.OK
-    assert response.json() == {'users': [user_schema]}
+    assert response.json() == {'users': [user_schema], 'next_cursor': None}
 
 
-def test_update_user(client, user, token):
-    response = client.put(
-        f'users/{user.id}',
-        headers={'Authorization': f'Bearer {token}'},
-        json={
-            'password': 'buçamole',
-            'username': 'testeusername2',
-            'email': 'teste@gmail.com',
-            'id': user.id,
-        },
-    )
+def test_read_users_should_paginate_with_cursor(client, user, user_fun):
+    response = client.get('/users/?limit=1')
+    first_page = response.json()
+
+    assert [u['id'] for u in first_page['users']] == [user.id]
+    assert first_page['next_cursor']
+
+    response = client.get(f'/users/?limit=1&after={first_page["next_cursor"]}')
+    second_page = response.json()
+
+    assert [u['id'] for u in second_page['users']] == [user_fun.id]
+    assert second_page['next_cursor'] is None
+
+
+def test_read_users_invalid_cursor(client):
+    response = client.get('/users/?after=not-a-cursor')
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'detail': 'Invalid cursor'}
+
+
+def test_read_users_limit_above_maximum(client):
+    response = client.get('/users/?limit=1000')
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_update_user(client, user, token, assert_max_queries):
+    with assert_max_queries(1):
+        response = client.put(
+            f'users/{user.id}',
+            headers={'Authorization': f'Bearer {token}'},
+            json={
+                'password': 'buçamole',
+                'username': 'testeusername2',
+                'email': 'teste@gmail.com',
+                'id': user.id,
+            },
+        )
     assert response.json() == {
         'username': 'testeusername2',
         'email': 'teste@gmail.com',
@@ -54,6 +84,55 @@ def test_update_user(client, user, token):
     }
 
 
+def test_update_user_should_hash_new_password(client, user, token):
+    client.put(
+        f'/users/{user.id}',
+        headers={'Authorization': f'Bearer {token}'},
+        json={
+            'password': 'nova-senha',
+            'username': user.username,
+            'email': user.email,
+        },
+    )
+
+    response = client.post(
+        '/auth/token',
+        data={'username': user.email, 'password': 'nova-senha'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_update_user_should_revoke_previous_tokens(client, user, token):
+    client.put(
+        f'/users/{user.id}',
+        headers={'Authorization': f'Bearer {token}'},
+        json={
+            'password': 'nova-senha',
+            'username': user.username,
+            'email': user.email,
+        },
+    )
+
+    response = client.get(
+        '/characters/', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_delete_user_should_revoke_previous_tokens(client, user, token):
+    client.delete(
+        f'/users/{user.id}', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    response = client.get(
+        '/characters/', headers={'Authorization': f'Bearer {token}'}
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+
 def test_error_update_user_not_enough_permissons(client, user_fun, token):
     response = client.put(
         f'/users/{user_fun.id}',
@@ -77,10 +156,11 @@ def test_delete_wrong_user(client, user_fun, token):
     assert response.json() == {'detail': 'Not enough permissions'}
 
 
-def test_delete_user(client, user, token):
-    response = client.delete(
-        f'/users/{user.id}', headers={'Authorization': f'Bearer {token}'}
-    )
+def test_delete_user(client, user, token, assert_max_queries):
+    with assert_max_queries(1):
+        response = client.delete(
+            f'/users/{user.id}', headers={'Authorization': f'Bearer {token}'}
+        )
 
     assert response.json() == {'message': 'User deleted'}
 
@@ -109,3 +189,20 @@ def test_create_user_should_retrun_400_email_exists(client, user):
     )
     assert response.status_code == HTTPStatus.BAD_REQUEST
     assert response.json() == {'detail': 'Email already exists'}
+
+
+def test_update_user_should_return_400_email_exists(
+    client, user, user_fun, token
+):
+    response = client.put(
+        f'/users/{user.id}',
+        headers={'Authorization': f'Bearer {token}'},
+        json={
+            'username': user.username,
+            'password': 'nova-senha',
+            'email': user_fun.email,
+        },
+    )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'detail': 'Email already exists'}